@@ -0,0 +1,118 @@
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+MINUTES_PER_DAY = 24 * 60
+# Bucket size in minutes for staffing profiles (60 gives an hourly curve)
+DEFAULT_INTERVAL = 60
+
+STAFFING_COLUMNS = ('time', 'average_on_site', 'peak_on_site', 'planned', 'shortfall')
+
+
+# SQL for minutes since midnight of an 'H:MM[:SS]' or 'HH:MM[:SS]' column
+_MINUTE_SQL = ("CAST(substr({0}, 1, instr({0}, ':') - 1) AS INTEGER) * 60"
+               " + CAST(substr({0}, instr({0}, ':') + 1, 2) AS INTEGER)")
+
+
+def _minute(value):
+    # 'H:MM[:SS]' -> minutes since midnight
+    hours, minutes = value.split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def _add_interval(deltas, day, start, end, count=1):
+    # Adds `count` people over [start, end) of day `day` to the difference array;
+    # an end before the start crosses midnight and an end equal to it (an in and
+    # out in the same minute) adds nothing. Anything outside is dropped.
+    if end == start:
+        return
+    begin = day * MINUTES_PER_DAY + start
+    finish = day * MINUTES_PER_DAY + end
+    if end < start:
+        finish += MINUTES_PER_DAY
+    if finish <= 0 or begin >= len(deltas) - 1:
+        return
+    deltas[max(0, begin)] += count
+    deltas[min(finish, len(deltas) - 1)] -= count
+
+
+def occupancy_curve(db, start_date, end_date, department=None):
+    # Builds per-minute headcounts for every day in the range from one query each
+    # for punches and shift assignments: every interval adds +1/-1 to a difference
+    # array and a single running sum turns it into the curve. Returns
+    # (first_day, days, actual, planned) with both lists days * 1440 long.
+    first = date.fromisoformat(start_date)
+    days = (date.fromisoformat(end_date) - first).days + 1
+    if days < 1:
+        raise ValueError("End date must not be before start date")
+    actual = [0] * (days * MINUTES_PER_DAY + 1)
+    planned = [0] * (days * MINUTES_PER_DAY + 1)
+
+    # Still on site: open punches for today run until now
+    now = datetime.now()
+    today = (now.date() - first).days
+    # The day before the range is read for overnight shifts that spill into it
+    previous = (first - timedelta(days=1)).isoformat()
+    offsets = {(first + timedelta(days=day)).isoformat(): day for day in range(-1, days)}
+    # Punches sharing the same day and minutes are counted by SQLite, so Python
+    # only sees one row per distinct interval
+    for day, time_in, time_out, count in db.conn.execute(f'''
+        SELECT a.date, {_MINUTE_SQL.format('a.time_in')}, {_MINUTE_SQL.format('a.time_out')},
+               COUNT(*)
+        FROM attendance a
+        JOIN employees e ON a.employee_id = e.employee_id
+        WHERE a.date BETWEEN ? AND ? AND a.time_in IS NOT NULL
+          AND (? IS NULL OR e.department = ?)
+        GROUP BY 1, 2, 3
+    ''', (previous, end_date, department, department)):
+        offset = offsets[day]
+        if time_out is not None:
+            _add_interval(actual, offset, time_in, time_out, count)
+        elif offset == today:
+            _add_interval(actual, offset, time_in, max(time_in + 1, now.hour * 60 + now.minute),
+                          count)
+
+    # Planned: each employee works the shift of their latest assignment on or
+    # before the day. Employees are counted per (day, shift) before marking.
+    assignments = db.conn.execute('''
+        SELECT es.employee_id, es.effective_date, s.start_time, s.end_time
+        FROM employee_shifts es
+        JOIN shifts s ON es.shift_id = s.shift_id
+        JOIN employees e ON es.employee_id = e.employee_id
+        WHERE es.effective_date <= ? AND e.status = 'Active'
+          AND (? IS NULL OR e.department = ?)
+        ORDER BY es.employee_id, es.effective_date, es.assignment_id
+    ''', (end_date, department, department)).fetchall()
+    scheduled = {}
+    for idx, (employee_id, effective, shift_start, shift_end) in enumerate(assignments):
+        following = assignments[idx + 1] if idx + 1 < len(assignments) else None
+        until = days
+        if following and following[0] == employee_id:
+            until = min(days, (date.fromisoformat(following[1]) - first).days)
+        # Day -1 covers overnight shifts running into the first day
+        for day in range(max(-1, (date.fromisoformat(effective) - first).days), until):
+            key = (day, shift_start, shift_end)
+            scheduled[key] = scheduled.get(key, 0) + 1
+    for (day, shift_start, shift_end), count in scheduled.items():
+        _add_interval(planned, day, _minute(shift_start), _minute(shift_end), count)
+
+    return first, days, list(accumulate(actual[:-1])), list(accumulate(planned[:-1]))
+
+
+def staffing_profile(db, start_date, end_date, department=None, interval=DEFAULT_INTERVAL):
+    # Folds the per-minute curve into time-of-day buckets averaged over the range.
+    # Rows are (time, average on site, peak on site, planned, average shortfall).
+    if interval < 1 or MINUTES_PER_DAY % interval:
+        raise ValueError(f"Interval must divide a day evenly, got {interval} minutes")
+    _, days, actual, planned = occupancy_curve(db, start_date, end_date, department)
+
+    samples = days * interval
+    rows = []
+    for minute in range(0, MINUTES_PER_DAY, interval):
+        starts = range(minute, len(actual), MINUTES_PER_DAY)
+        on_site = [actual[i:i + interval] for i in starts]
+        average = sum(map(sum, on_site)) / samples
+        expected = sum(sum(planned[i:i + interval]) for i in starts) / samples
+        peak = max(map(max, on_site))
+        rows.append((f"{minute // 60:02d}:{minute % 60:02d}", round(average, 2), peak,
+                     round(expected, 2), round(max(0.0, expected - average), 2)))
+    return rows
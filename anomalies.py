@@ -0,0 +1,315 @@
+import heapq
+import json
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, time, timedelta
+
+# Different barcodes read at one terminal within BURST_WINDOW seconds; BURST_SIZE
+# or more looks like one person punching a stack of cards
+BURST_WINDOW = 2.0
+BURST_SIZE = 3
+# Minutes a punch may be away from the assigned shift's start (in) or end (out)
+SHIFT_TOLERANCE = 120
+# Longest plausible time between time in and time out
+MAX_SHIFT_HOURS = 16
+# Bounds on the state kept per terminal and per employee
+MAX_TERMINALS = 256
+MAX_EMPLOYEES = 4096
+# Punches waiting for the monitor thread; when full new punches are dropped so a
+# scan never waits on detection
+QUEUE_SIZE = 10000
+# Alerts written per transaction during a backfill
+ALERT_BATCH = 1000
+# Write notifications the monitor acts on
+WATCHED_TABLES = ('punch', 'shifts', 'employee_shifts')
+
+ALERT_COLUMNS = ('alert_id', 'kind', 'employee_id', 'barcode_id', 'terminal', 'punched_at',
+                 'details', 'created_at')
+
+
+def _minute(value):
+    # 'H:MM[:SS]' -> minutes since midnight
+    hours, minutes = value.split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def _parse_date(value):
+    # 'YYYY-MM-DD' as a date; None when missing or unreadable
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_time(value):
+    # 'H:MM[:SS]' as a time; None when missing or unreadable
+    try:
+        return time(*[int(part) for part in value.split(':')[:3]])
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def save_alerts(conn, alerts):
+    # alerts are (kind, employee_id, barcode_id, terminal, punched_at, details);
+    # returns how many were new
+    before = conn.total_changes
+    with conn:
+        conn.executemany('''
+            INSERT OR IGNORE INTO attendance_alerts
+            (kind, employee_id, barcode_id, terminal, punched_at, details)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', alerts)
+    return conn.total_changes - before
+
+
+def get_alerts(conn, start_date, end_date, kind=None):
+    return conn.execute('''
+        SELECT * FROM attendance_alerts
+        WHERE punched_at >= ? AND punched_at < date(?, '+1 day') AND (? IS NULL OR kind = ?)
+        ORDER BY punched_at, alert_id
+    ''', (start_date, end_date, kind, kind)).fetchall()
+
+
+class ShiftSchedule:
+    # Effective-dated shift assignments per employee, newest first. Only the most
+    # recently used employees are kept.
+    def __init__(self, conn, max_entries=MAX_EMPLOYEES):
+        self.conn = conn
+        self.max_entries = max_entries
+        self._assignments = OrderedDict()
+
+    def shift_for(self, employee_id, date):
+        # Returns (start_time, end_time) of the shift in effect on date, or None
+        assignments = self._assignments.get(employee_id)
+        if assignments is None:
+            assignments = self.conn.execute('''
+                SELECT es.effective_date, s.start_time, s.end_time
+                FROM employee_shifts es
+                JOIN shifts s ON es.shift_id = s.shift_id
+                WHERE es.employee_id = ?
+                ORDER BY es.effective_date DESC, es.assignment_id DESC
+            ''', (employee_id,)).fetchall()
+            self._assignments[employee_id] = assignments
+            if len(self._assignments) > self.max_entries:
+                self._assignments.popitem(last=False)
+        else:
+            self._assignments.move_to_end(employee_id)
+        for effective_date, start_time, end_time in assignments:
+            if effective_date <= date:
+                return start_time, end_time
+        return None
+
+    def clear(self):
+        self._assignments.clear()
+
+
+class AnomalyDetector:
+    # Looks at one punch at a time, in time order, and returns the alerts it raises.
+    # State is bounded: a short window of reads per terminal for the most recently
+    # active terminals; shifts come from shift_lookup(employee_id, date).
+    def __init__(self, shift_lookup, burst_window=BURST_WINDOW, burst_size=BURST_SIZE,
+                 shift_tolerance=SHIFT_TOLERANCE, max_shift_hours=MAX_SHIFT_HOURS,
+                 max_terminals=MAX_TERMINALS):
+        self.shift_lookup = shift_lookup
+        self.burst_window = burst_window
+        self.burst_size = burst_size
+        self.shift_tolerance = shift_tolerance
+        self.max_shift = timedelta(hours=max_shift_hours)
+        self.max_terminals = max_terminals
+        # terminal -> reads inside the burst window as [timestamp, barcode, employee_id, flagged]
+        self._terminals = OrderedDict()
+
+    def observe(self, barcode_id, employee_id, action, when, terminal=None, started=None):
+        # action is a punch_barcode action; started is the time in (datetime) for an 'out'
+        alerts = []
+        if terminal is not None:
+            alerts += self._check_burst(barcode_id, employee_id, when, terminal)
+        if employee_id is not None and action in ('in', 'out'):
+            alerts += self._check_shift(barcode_id, employee_id, action, when, terminal)
+        if action == 'out' and started and when - started > self.max_shift:
+            hours = round((when - started).total_seconds() / 3600, 2)
+            alerts.append(self._alert('long_shift', employee_id, barcode_id, terminal, when,
+                                      time_in=started.strftime('%Y-%m-%d %H:%M:%S'), hours=hours))
+        return alerts
+
+    def _alert(self, kind, employee_id, barcode_id, terminal, when, **details):
+        return (kind, employee_id, barcode_id, terminal, when.strftime('%Y-%m-%d %H:%M:%S'),
+                json.dumps(details))
+
+    def _check_burst(self, barcode_id, employee_id, when, terminal):
+        now = when.timestamp()
+        reads = self._terminals.pop(terminal, None)
+        if reads is None:
+            reads = deque(maxlen=max(64, self.burst_size * 4))
+        # Least recently active terminals are forgotten first
+        self._terminals[terminal] = reads
+        if len(self._terminals) > self.max_terminals:
+            self._terminals.popitem(last=False)
+
+        while reads and now - reads[0][0] > self.burst_window:
+            reads.popleft()
+        reads.append([now, barcode_id, employee_id, False])
+
+        barcodes = {read[1] for read in reads}
+        if len(barcodes) < self.burst_size:
+            return []
+        # Every read in the burst is flagged once, including those before the threshold
+        alerts = []
+        span = round(now - reads[0][0], 3)
+        for read in reads:
+            if not read[3]:
+                read[3] = True
+                alerts.append(self._alert('burst', read[2], read[1], terminal,
+                                          datetime.fromtimestamp(read[0]),
+                                          barcodes=len(barcodes), seconds=span))
+        return alerts
+
+    def _check_shift(self, barcode_id, employee_id, action, when, terminal):
+        shift = self.shift_lookup(employee_id, when.strftime('%Y-%m-%d'))
+        if not shift:
+            return []
+        expected = _minute(shift[0] if action == 'in' else shift[1])
+        # Distance around the clock, so 23:50 is 20 minutes from 00:10
+        off = abs(when.hour * 60 + when.minute - expected)
+        off = min(off, 24 * 60 - off)
+        if off <= self.shift_tolerance:
+            return []
+        return [self._alert('off_shift', employee_id, barcode_id, terminal, when, action=action,
+                            shift_start=shift[0], shift_end=shift[1], minutes_off=off)]
+
+
+class AnomalyMonitor:
+    # Feeds punches from db's write listener to an AnomalyDetector on a background
+    # thread. The punch itself only enqueues; lookups and alert writes happen on
+    # the thread's own connection.
+    def __init__(self, db, queue_size=QUEUE_SIZE, timeout=5.0, **options):
+        self.db = db
+        self.timeout = timeout
+        self.options = options
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.metrics = {'processed': 0, 'alerts': 0, 'dropped': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='anomaly-monitor', daemon=True)
+        self._thread.start()
+        db.add_write_listener(self.on_write)
+
+    def on_write(self, table, details):
+        if table not in WATCHED_TABLES:
+            return
+        try:
+            self.queue.put_nowait((table, details))
+        except queue.Full:
+            self.metrics['dropped'] += 1
+
+    def replay(self, writes):
+        # Feeds (table, details) notifications collected elsewhere, e.g. during a
+        # batch, waiting for room in the queue instead of dropping
+        for table, details in writes:
+            if table in WATCHED_TABLES:
+                self.queue.put((table, details))
+
+    def _run(self):
+        conn = sqlite3.connect(self.db.db_name, timeout=self.timeout)
+        schedule = ShiftSchedule(conn)
+        detector = AnomalyDetector(schedule.shift_for, **self.options)
+        running = True
+        while running:
+            # Take everything waiting so a burst of punches is one transaction
+            items = [self.queue.get()]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            alerts = []
+            try:
+                for item in items:
+                    if item is None:
+                        running = False
+                        continue
+                    # A punch that cannot be checked is counted and skipped; the
+                    # thread has to outlive it or flush() would wait forever
+                    try:
+                        alerts += self._check(schedule, detector, *item)
+                    except Exception:
+                        self.metrics['errors'] += 1
+                if alerts:
+                    self.metrics['alerts'] += save_alerts(conn, alerts)
+            except sqlite3.Error:
+                self.metrics['errors'] += 1
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+        conn.close()
+
+    def _check(self, schedule, detector, table, details):
+        if table != 'punch':
+            schedule.clear()
+            return []
+        when = details['when']
+        started = _parse_time(details['time_in'])
+        if started is not None:
+            started = datetime.combine(when.date(), started)
+        alerts = detector.observe(details['barcode_id'], details['employee_id'],
+                                  details['action'], when, details['terminal'], started)
+        self.metrics['processed'] += 1
+        return alerts
+
+    def flush(self):
+        # Waits until every queued punch has been checked and its alerts written
+        self.queue.join()
+
+    def close(self):
+        self.db.remove_write_listener(self.on_write)
+        self.queue.put(None)
+        self._thread.join()
+
+
+def backfill(db, start_date, end_date, **options):
+    # Replays stored attendance as one time-ordered stream of ins and outs. Rows
+    # come sorted by time in; each time out waits in a heap until the stream
+    # reaches it. Stored rows carry no terminal, so bursts are not detected here.
+    schedule = ShiftSchedule(db.conn)
+    detector = AnomalyDetector(schedule.shift_for, **options)
+    pending, alerts = [], []
+    punches = saved = skipped = 0
+
+    def observe(*punch):
+        nonlocal punches, saved, alerts
+        alerts += detector.observe(*punch)
+        punches += 1
+        if len(alerts) >= ALERT_BATCH:
+            saved += save_alerts(db.conn, alerts)
+            alerts = []
+
+    for employee_id, barcode_id, date, time_in, time_out in db.conn.execute('''
+        SELECT a.employee_id, e.barcode_id, a.date, a.time_in, a.time_out
+        FROM attendance a
+        JOIN employees e ON a.employee_id = e.employee_id
+        WHERE a.date BETWEEN ? AND ? AND a.time_in IS NOT NULL
+        ORDER BY a.date, a.time_in
+    ''', (start_date, end_date)):
+        # Rows with a date or time that can't be read are counted and left out
+        day, time_in, finished = _parse_date(date), _parse_time(time_in), _parse_time(time_out)
+        if day is None or time_in is None or (time_out and finished is None):
+            skipped += 1
+            continue
+        started = datetime.combine(day, time_in)
+        while pending and pending[0][0] <= started:
+            observe(*heapq.heappop(pending)[2])
+        observe(barcode_id, employee_id, 'in', started)
+        if finished is not None:
+            finished = datetime.combine(day, finished)
+            # A time out before the time in was the next morning
+            if finished < started:
+                finished += timedelta(days=1)
+            heapq.heappush(pending, (finished, punches, (barcode_id, employee_id, 'out', finished,
+                                                         None, started)))
+    while pending:
+        observe(*heapq.heappop(pending)[2])
+
+    if alerts:
+        saved += save_alerts(db.conn, alerts)
+    return {'punches': punches, 'alerts': saved, 'skipped': skipped}
@@ -1,15 +1,46 @@
 import sqlite3
+from contextlib import contextmanager
 from datetime import datetime
-import hashlib
-import getpass
+from pathlib import Path
+
+from bitmaps import rebuild_bitmaps, set_day_status
+
+# Bump when the schema changes so existing databases are migrated once on open
+SCHEMA_VERSION = 7
+
+# Tables whose changes are captured in the changelog: table -> (key column, data columns)
+TRACKED_TABLES = {
+    'employees': ('employee_id', ('name', 'barcode_id', 'department', 'position', 'hire_date', 'status')),
+    'shifts': ('shift_id', ('name', 'start_time', 'end_time', 'description')),
+    'employee_shifts': ('assignment_id', ('employee_id', 'shift_id', 'effective_date')),
+    'attendance': ('record_id', ('employee_id', 'date', 'time_in', 'time_out', 'status')),
+}
+
+# Rows read per statement by the iter_* methods
+ITER_CHUNK_SIZE = 500
 
 class AttendanceDB:
-    def __init__(self, db_name='attendance_system.db'):
-        self.conn = sqlite3.connect(db_name)
+    def __init__(self, db_name='attendance_system.db', timeout=5.0, enforce_foreign_keys=False):
+        self.db_name = db_name
+        # Seconds to wait on another connection's lock before "database is locked"
+        self.conn = sqlite3.connect(db_name, timeout=timeout)
         self.cursor = self.conn.cursor()
+        if enforce_foreign_keys:
+            # SQLite ignores the schema's FOREIGN KEY clauses unless asked per connection
+            self.cursor.execute('PRAGMA foreign_keys = ON')
+        self.write_listeners = []
+        self._in_batch = False
+        # Optional scanner.ScanDebouncer that drops repeat reads in punch_barcode
+        self.debouncer = None
         self.create_tables()
         
     def create_tables(self):
+        # Skip schema setup entirely when the database is already current
+        self.cursor.execute('PRAGMA user_version')
+        version = self.cursor.fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+            
         # Employees table
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS employees (
@@ -71,20 +102,242 @@ class AttendanceDB:
             )
         ''')
         
+        if version < 2:
+            self._create_changelog()
+            
+        if version < 3:
+            self._create_archive_tables()
+            
+        if version < 4:
+            self._create_alerts_table()
+            
+        if version < 5:
+            self._create_bitmaps_table()
+            
+        if version < 6:
+            self._create_departments()
+            
+        if version < 7:
+            self._create_site_info()
+        
+        self.cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
         self.conn.commit()
         
+    def _create_changelog(self):
+        # Change capture for incremental sync: every write to a tracked table
+        # appends one row with a monotonically increasing sequence number
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS changelog (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                op TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                row_data TEXT,
+                changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+            )
+        ''')
+        
+        for table, (key, columns) in TRACKED_TABLES.items():
+            for event, op, row in (('INSERT', 'I', 'NEW'), ('UPDATE', 'U', 'NEW'), ('DELETE', 'D', 'OLD')):
+                if op == 'D':
+                    data = 'NULL'
+                else:
+                    data = 'json_object({})'.format(
+                        ', '.join(f"'{column}', NEW.{column}" for column in columns))
+                self.cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS changelog_{table}_{event.lower()}
+                    AFTER {event} ON {table}
+                    BEGIN
+                        INSERT INTO changelog (table_name, op, row_id, row_data)
+                        VALUES ('{table}', '{op}', {row}.{key}, {data});
+                    END
+                ''')
+                
+            # Rows written before change capture existed are logged as inserts
+            self.cursor.execute(f'''
+                INSERT INTO changelog (table_name, op, row_id, row_data)
+                SELECT '{table}', 'I', {key}, json_object({', '.join(f"'{c}', {c}" for c in columns)})
+                FROM {table}
+            ''')
+        
+    def _create_archive_tables(self):
+        # Rows removed by integrity repairs are kept here rather than lost
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance_archive (
+                record_id INTEGER PRIMARY KEY,
+                employee_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                time_in TEXT,
+                time_out TEXT,
+                status TEXT,
+                archived_at TEXT NOT NULL,
+                reason TEXT NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS employee_shifts_archive (
+                assignment_id INTEGER PRIMARY KEY,
+                employee_id INTEGER NOT NULL,
+                shift_id INTEGER NOT NULL,
+                effective_date TEXT NOT NULL,
+                archived_at TEXT NOT NULL,
+                reason TEXT NOT NULL
+            )
+        ''')
+        
+        # Serves record_attendance's lookup and the chunked duplicate scan. Not
+        # unique, since existing databases may already contain duplicates.
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_attendance_employee_date
+            ON attendance (employee_id, date)
+        ''')
+        
+    def _create_alerts_table(self):
+        # Suspicious punches flagged by anomalies.AnomalyMonitor; one alert per
+        # kind and punch, so a backfill can be re-run over the same dates
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance_alerts (
+                alert_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                employee_id INTEGER,
+                barcode_id TEXT,
+                terminal TEXT,
+                punched_at TEXT NOT NULL,
+                details TEXT,
+                created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+                UNIQUE (kind, barcode_id, punched_at)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_attendance_alerts_punched_at
+            ON attendance_alerts (punched_at)
+        ''')
+        
+    def _create_bitmaps_table(self):
+        # Day-per-bit status bitmaps kept in step by record_attendance, see bitmaps.py
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance_bitmaps (
+                employee_id INTEGER NOT NULL,
+                year INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                bits BLOB NOT NULL,
+                PRIMARY KEY (employee_id, year, status)
+            ) WITHOUT ROWID
+        ''')
+        rebuild_bitmaps(self.conn)
+        
+    def _create_site_info(self):
+        # A random ID made once per database, so sites that all run the default
+        # file name are still told apart by the central sync
+        import uuid
+
+        self.cursor.execute('CREATE TABLE IF NOT EXISTS site_info (site_id TEXT NOT NULL)')
+        if not self.cursor.execute('SELECT 1 FROM site_info').fetchone():
+            self.cursor.execute('INSERT INTO site_info (site_id) VALUES (?)', (uuid.uuid4().hex,))
+        
+    def _create_departments(self):
+        # Department tree with a closure table: one row per (ancestor, descendant)
+        # pair, including each department paired with itself at depth 0
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS departments (
+                department_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                parent_id INTEGER,
+                FOREIGN KEY (parent_id) REFERENCES departments (department_id)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS department_closure (
+                ancestor_id INTEGER NOT NULL,
+                descendant_id INTEGER NOT NULL,
+                depth INTEGER NOT NULL,
+                PRIMARY KEY (ancestor_id, descendant_id)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_department_closure_descendant
+            ON department_closure (descendant_id)
+        ''')
+        
+        # employees.department stays as the display name; department_id links it
+        # into the tree
+        columns = [row[1] for row in self.cursor.execute('PRAGMA table_info(employees)')]
+        if 'department_id' not in columns:
+            self.cursor.execute('''
+                ALTER TABLE employees ADD COLUMN department_id INTEGER
+                REFERENCES departments (department_id)
+            ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_employees_department_id
+            ON employees (department_id)
+        ''')
+        
+        # Existing free-text departments become top-level departments
+        names = [row[0] for row in self.cursor.execute('SELECT DISTINCT department FROM employees')]
+        for name in names:
+            self._department_id(name)
+        self.cursor.execute('''
+            UPDATE employees SET department_id =
+                (SELECT department_id FROM departments WHERE name = employees.department)
+        ''')
+        
+    def _commit(self):
+        # Inside batch() everything is committed once at the end
+        if not self._in_batch:
+            self.conn.commit()
+            
+    @contextmanager
+    def batch(self):
+        self._in_batch = True
+        try:
+            yield self
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self._in_batch = False
+        
+    # Write listeners are called as listener(table, details) after each change
+    def add_write_listener(self, listener):
+        self.write_listeners.append(listener)
+        
+    def remove_write_listener(self, listener):
+        if listener in self.write_listeners:
+            self.write_listeners.remove(listener)
+            
+    def _notify_write(self, table, **details):
+        for listener in self.write_listeners:
+            listener(table, details)
+        
     # Employee operations
     def add_employee(self, name, barcode_id, department, position, hire_date):
+        # A department created for the employee is undone with the savepoint when
+        # the insert fails (e.g. a duplicate barcode). The savepoint always sits in
+        # an open transaction, so RELEASE never commits and batch() stays atomic.
+        if not self.conn.in_transaction:
+            self.cursor.execute('BEGIN')
+        self.cursor.execute('SAVEPOINT add_employee')
         try:
             self.cursor.execute('''
-                INSERT INTO employees (name, barcode_id, department, position, hire_date)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (name, barcode_id, department, position, hire_date))
-            self.conn.commit()
-            return True
+                INSERT INTO employees (name, barcode_id, department, position, hire_date, department_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (name, barcode_id, department, position, hire_date, self._department_id(department)))
         except sqlite3.IntegrityError:
+            self.cursor.execute('ROLLBACK TO add_employee')
+            self.cursor.execute('RELEASE add_employee')
+            self._commit()
             return False
+        employee_id = self.cursor.lastrowid
+        self.cursor.execute('RELEASE add_employee')
+        self._commit()
+        self._notify_write('employees', employee_id=employee_id)
+        return True
             
+    def get_employee(self, employee_id):
+        self.cursor.execute('SELECT * FROM employees WHERE employee_id = ?', (employee_id,))
+        return self.cursor.fetchone()
+        
     def get_employee_by_barcode(self, barcode_id):
         self.cursor.execute('SELECT * FROM employees WHERE barcode_id = ?', (barcode_id,))
         return self.cursor.fetchone()
@@ -93,17 +346,131 @@ class AttendanceDB:
         self.cursor.execute('SELECT * FROM employees ORDER BY name')
         return self.cursor.fetchall()
         
+    def iter_employees(self):
+        return self._iter_keyset('SELECT * FROM employees WHERE 1', [], ('name', 'employee_id'),
+                                 lambda row: (row[1], row[0]))
+        
     def update_employee(self, employee_id, name, department, position, status):
         self.cursor.execute('''
             UPDATE employees 
-            SET name = ?, department = ?, position = ?, status = ?
+            SET name = ?, department = ?, position = ?, status = ?, department_id = ?
             WHERE employee_id = ?
-        ''', (name, department, position, status, employee_id))
-        self.conn.commit()
+        ''', (name, department, position, status, self._department_id(department), employee_id))
+        self._commit()
+        self._notify_write('employees', employee_id=employee_id)
         
     def delete_employee(self, employee_id):
-        self.cursor.execute('DELETE FROM employees WHERE employee_id = ?', (employee_id,))
-        self.conn.commit()
+        try:
+            self.cursor.execute('DELETE FROM employees WHERE employee_id = ?', (employee_id,))
+        except sqlite3.IntegrityError:
+            # Only raised with enforce_foreign_keys while the employee still has records.
+            # The failed statement is undone; ending the transaction releases its lock.
+            self._commit()
+            return False
+        self._commit()
+        self._notify_write('employees', employee_id=employee_id)
+        return True
+        
+    # Department operations
+    def _department_id(self, name):
+        # Id of the department called name, created at the top level if new
+        if not name:
+            return None
+        row = self.conn.execute('SELECT department_id FROM departments WHERE name = ?',
+                                (name,)).fetchone()
+        return row[0] if row else self._insert_department(name, None)
+        
+    def _insert_department(self, name, parent_id):
+        department_id = self.conn.execute('INSERT INTO departments (name, parent_id) VALUES (?, ?)',
+                                          (name, parent_id)).lastrowid
+        # Linked to itself and to every ancestor of its parent
+        self.conn.execute('''
+            INSERT INTO department_closure (ancestor_id, descendant_id, depth)
+            SELECT ?, ?, 0
+            UNION ALL
+            SELECT ancestor_id, ?, depth + 1 FROM department_closure WHERE descendant_id = ?
+        ''', (department_id, department_id, department_id, parent_id))
+        return department_id
+        
+    def add_department(self, name, parent_id=None):
+        try:
+            department_id = self._insert_department(name, parent_id)
+        except sqlite3.IntegrityError:
+            return None
+        self._commit()
+        self._notify_write('departments', department_id=department_id)
+        return department_id
+        
+    def move_department(self, department_id, parent_id):
+        # Re-parents a department with its whole subtree; refuses to move it under itself
+        if parent_id is not None and self.conn.execute('''
+            SELECT 1 FROM department_closure WHERE ancestor_id = ? AND descendant_id = ?
+        ''', (department_id, parent_id)).fetchone():
+            return False
+        subtree = 'SELECT descendant_id FROM department_closure WHERE ancestor_id = ?'
+        # Drop links from the old ancestors into the subtree, then link the new ones
+        self.conn.execute(f'''
+            DELETE FROM department_closure
+            WHERE descendant_id IN ({subtree}) AND ancestor_id NOT IN ({subtree})
+        ''', (department_id, department_id))
+        self.conn.execute(f'''
+            INSERT INTO department_closure (ancestor_id, descendant_id, depth)
+            SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1
+            FROM department_closure a, department_closure d
+            WHERE a.descendant_id = ? AND d.ancestor_id = ?
+        ''', (parent_id, department_id))
+        self.conn.execute('UPDATE departments SET parent_id = ? WHERE department_id = ?',
+                          (parent_id, department_id))
+        self._commit()
+        self._notify_write('departments', department_id=department_id)
+        return True
+        
+    def get_departments(self):
+        # (department_id, name, parent_id, level, headcount) in tree order, where
+        # headcount counts active employees in every department below
+        self.cursor.execute('''
+            SELECT d.department_id, d.name, d.parent_id,
+                   (SELECT MAX(depth) FROM department_closure WHERE descendant_id = d.department_id),
+                   COUNT(e.employee_id)
+            FROM departments d
+            JOIN department_closure c ON c.ancestor_id = d.department_id
+            LEFT JOIN employees e ON e.department_id = c.descendant_id AND e.status = 'Active'
+            GROUP BY d.department_id
+        ''')
+        return _tree_order(self.cursor.fetchall())
+        
+    def get_department_rollup(self, start_date, end_date):
+        # Attendance counts per department including all departments below it, as
+        # (department_id, name, parent_id, level, headcount, present, absent, late)
+        # in tree order. Attendance is counted once per leaf department and then
+        # summed up the closure table, all in one query.
+        self.cursor.execute('''
+            WITH own AS (
+                SELECT e.department_id,
+                       SUM(a.status = 'Present') AS present,
+                       SUM(a.status = 'Absent') AS absent,
+                       SUM(a.status = 'Late') AS late
+                FROM attendance a
+                JOIN employees e ON a.employee_id = e.employee_id
+                WHERE a.date BETWEEN ? AND ? AND e.department_id IS NOT NULL
+                GROUP BY e.department_id
+            ), heads AS (
+                SELECT department_id, COUNT(*) AS headcount
+                FROM employees
+                WHERE department_id IS NOT NULL AND status = 'Active'
+                GROUP BY department_id
+            )
+            SELECT d.department_id, d.name, d.parent_id,
+                   (SELECT MAX(depth) FROM department_closure WHERE descendant_id = d.department_id),
+                   COALESCE(SUM(h.headcount), 0), COALESCE(SUM(o.present), 0),
+                   COALESCE(SUM(o.absent), 0), COALESCE(SUM(o.late), 0)
+            FROM departments d
+            JOIN department_closure c ON c.ancestor_id = d.department_id
+            LEFT JOIN own o ON o.department_id = c.descendant_id
+            LEFT JOIN heads h ON h.department_id = c.descendant_id
+            GROUP BY d.department_id
+        ''', (start_date, end_date))
+        return _tree_order(self.cursor.fetchall())
         
     # Shift operations
     def add_shift(self, name, start_time, end_time, description=None):
@@ -111,8 +478,10 @@ class AttendanceDB:
             INSERT INTO shifts (name, start_time, end_time, description)
             VALUES (?, ?, ?, ?)
         ''', (name, start_time, end_time, description))
-        self.conn.commit()
-        return self.cursor.lastrowid
+        self._commit()
+        shift_id = self.cursor.lastrowid
+        self._notify_write('shifts', shift_id=shift_id)
+        return shift_id
         
     def get_all_shifts(self):
         self.cursor.execute('SELECT * FROM shifts ORDER BY start_time')
@@ -123,7 +492,9 @@ class AttendanceDB:
             INSERT INTO employee_shifts (employee_id, shift_id, effective_date)
             VALUES (?, ?, ?)
         ''', (employee_id, shift_id, effective_date))
-        self.conn.commit()
+        self._commit()
+        self._notify_write('employee_shifts', employee_id=employee_id, shift_id=shift_id,
+                           effective_date=effective_date)
         
     def get_employee_shift(self, employee_id, date):
         self.cursor.execute('''
@@ -152,13 +523,21 @@ class AttendanceDB:
                     SET time_out = ?, status = ?
                     WHERE record_id = ?
                 ''', (time_out, status, existing[0]))
+                time_in = existing[3]
             elif time_in:
                 self.cursor.execute('''
                     UPDATE attendance 
                     SET time_in = ?, status = ?
                     WHERE record_id = ?
                 ''', (time_in, status, existing[0]))
-            self.conn.commit()
+                time_out = existing[4]
+            else:
+                time_in, time_out, status = existing[3], existing[4], existing[5]
+            set_day_status(self.conn, employee_id, date, status)
+            self._commit()
+            # Listeners see the row as it is after the update
+            self._notify_write('attendance', record_id=existing[0], employee_id=employee_id,
+                               date=date, time_in=time_in, time_out=time_out, status=status)
             return False  # Record updated
         else:
             # Create new record
@@ -166,10 +545,51 @@ class AttendanceDB:
                 INSERT INTO attendance (employee_id, date, time_in, time_out, status)
                 VALUES (?, ?, ?, ?, ?)
             ''', (employee_id, date, time_in, time_out, status))
-            self.conn.commit()
+            record_id = self.cursor.lastrowid
+            set_day_status(self.conn, employee_id, date, status)
+            self._commit()
+            self._notify_write('attendance', record_id=record_id, employee_id=employee_id,
+                               date=date, time_in=time_in, time_out=time_out, status=status)
             return True  # New record created
             
-    def get_attendance_records(self, start_date, end_date, employee_id=None):
+    def punch_barcode(self, barcode_id, when=None, terminal=None):
+        # Returns (employee, action, time) where action is 'in', 'out', 'complete',
+        # 'unknown' or 'duplicate'. Every read that is not a duplicate is also
+        # announced to write listeners as a 'punch'.
+        when = when or datetime.now()
+        current_date = when.strftime('%Y-%m-%d')
+        current_time = when.strftime('%H:%M:%S')
+        
+        # Scanners often send the same barcode twice; drop the repeat before any query
+        if self.debouncer and not self.debouncer.accept(barcode_id, when.timestamp()):
+            return None, 'duplicate', current_time
+        
+        employee = self.get_employee_by_barcode(barcode_id)
+        if not employee:
+            self._notify_write('punch', barcode_id=barcode_id, employee_id=None, action='unknown',
+                               when=when, terminal=terminal, time_in=None)
+            return None, 'unknown', current_time
+            
+        # Check if employee has already checked in today
+        self.cursor.execute('''
+            SELECT * FROM attendance 
+            WHERE employee_id = ? AND date = ?
+        ''', (employee[0], current_date))
+        record = self.cursor.fetchone()
+        
+        if record and record[3] and record[4]:  # Already has time_in and time_out
+            action = 'complete'
+        elif record and record[3]:  # Has time_in but no time_out
+            self.record_attendance(employee[0], current_date, time_out=current_time, status="Present")
+            action = 'out'
+        else:  # No record yet
+            self.record_attendance(employee[0], current_date, time_in=current_time, status="Present")
+            action = 'in'
+        self._notify_write('punch', barcode_id=barcode_id, employee_id=employee[0], action=action,
+                           when=when, terminal=terminal, time_in=record[3] if record else None)
+        return employee, action, current_time
+            
+    def _attendance_query(self, start_date, end_date, employee_id=None):
         query = '''
             SELECT a.*, e.name 
             FROM attendance a
@@ -182,31 +602,109 @@ class AttendanceDB:
             query += ' AND a.employee_id = ?'
             params.append(employee_id)
             
-        query += ' ORDER BY a.date, e.name'
+        return query, params
+        
+    def get_attendance_records(self, start_date, end_date, employee_id=None):
+        query, params = self._attendance_query(start_date, end_date, employee_id)
+        self.cursor.execute(query + ' ORDER BY a.date, e.name, a.record_id', params)
+        return self.cursor.fetchall()
+        
+    # The iter_* methods stream rows page by page. Each chunk is read in full and
+    # the next one starts after the last row's sort key, so no statement (and no
+    # read lock blocking other terminals' writes) stays open between pages.
+    def iter_attendance_records(self, start_date, end_date, employee_id=None):
+        query, params = self._attendance_query(start_date, end_date, employee_id)
+        return self._iter_keyset(query, params, ('a.date', 'e.name', 'a.record_id'),
+                                 lambda row: (row[2], row[6], row[0]))
+        
+    def _iter_keyset(self, query, params, order, key):
+        # query must end in a WHERE clause; key(row) gives the row's order values
+        last = None
+        while True:
+            after = ''
+            if last is not None:
+                after = f" AND ({', '.join(order)}) > ({', '.join('?' for _ in order)})"
+            rows = self.conn.execute(f"{query}{after} ORDER BY {', '.join(order)} LIMIT ?",
+                                     list(params) + list(last or ()) + [ITER_CHUNK_SIZE]).fetchall()
+            yield from rows
+            if len(rows) < ITER_CHUNK_SIZE:
+                return
+            last = key(rows[-1])
+        
+    def count_attendance_records(self, start_date, end_date, employee_id=None):
+        query, params = self._attendance_query(start_date, end_date, employee_id)
+        return self.conn.execute(f'SELECT COUNT(*) FROM ({query})', params).fetchone()[0]
         
-        self.cursor.execute(query, params)
+    def iter_attendance_totals(self, start_date, end_date):
+        # get_attendance_totals in employee_id order, ITER_CHUNK_SIZE employees per
+        # statement so callers can report progress and stop between chunks
+        last = 0
+        while True:
+            rows = self.conn.execute('''
+                SELECT a.employee_id, e.name,
+                       SUM(a.status = 'Present'), SUM(a.status = 'Absent'), SUM(a.status = 'Late'),
+                       COUNT(*)
+                FROM attendance a
+                JOIN employees e ON a.employee_id = e.employee_id
+                WHERE a.employee_id > ? AND a.date BETWEEN ? AND ?
+                GROUP BY a.employee_id
+                ORDER BY a.employee_id
+                LIMIT ?
+            ''', (last, start_date, end_date, ITER_CHUNK_SIZE)).fetchall()
+            yield from rows
+            if len(rows) < ITER_CHUNK_SIZE:
+                return
+            last = rows[-1][0]
+        
+    def get_attendance_totals(self, start_date, end_date):
+        # Per-employee status counts, aggregated by SQLite instead of in Python
+        self.cursor.execute('''
+            SELECT a.employee_id, e.name,
+                   SUM(a.status = 'Present'), SUM(a.status = 'Absent'), SUM(a.status = 'Late'),
+                   COUNT(*)
+            FROM attendance a
+            JOIN employees e ON a.employee_id = e.employee_id
+            WHERE a.date BETWEEN ? AND ?
+            GROUP BY a.employee_id
+            ORDER BY e.name
+        ''', (start_date, end_date))
         return self.cursor.fetchall()
         
     # Admin operations
     def add_admin_user(self, username, password, full_name, role):
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
+        from auth import hash_password
+        password_hash = hash_password(password)
         try:
             self.cursor.execute('''
                 INSERT INTO admin_users (username, password_hash, full_name, role)
                 VALUES (?, ?, ?, ?)
             ''', (username, password_hash, full_name, role))
-            self.conn.commit()
+            self._commit()
             return True
         except sqlite3.IntegrityError:
             return False
             
     def verify_admin(self, username, password):
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        self.cursor.execute('''
-            SELECT * FROM admin_users 
-            WHERE username = ? AND password_hash = ?
-        ''', (username, password_hash))
-        return self.cursor.fetchone()
+        from auth import dummy_verify, hash_password, needs_rehash, verify_password
+        self.cursor.execute('SELECT * FROM admin_users WHERE username = ?', (username,))
+        admin = self.cursor.fetchone()
+        if not admin:
+            dummy_verify(password)
+            return None
+        if not verify_password(password, admin[2]):
+            return None
+            
+        # Upgrade legacy SHA-256 hashes and hashes made with an older cost
+        if needs_rehash(admin[2]):
+            password_hash = hash_password(password)
+            self.cursor.execute('''
+                UPDATE admin_users 
+                SET password_hash = ?
+                WHERE user_id = ?
+            ''', (password_hash, admin[0]))
+            self._commit()
+            admin = admin[:2] + (password_hash,) + admin[3:]
+        return admin
         
     def update_admin_last_login(self, username):
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -215,25 +713,26 @@ class AttendanceDB:
             SET last_login = ?
             WHERE username = ?
         ''', (now, username))
-        self.conn.commit()
+        self._commit()
         
     def get_all_admins(self):
         self.cursor.execute('SELECT user_id, username, full_name, role FROM admin_users')
         return self.cursor.fetchall()
         
     def change_admin_password(self, username, new_password):
-        password_hash = hashlib.sha256(new_password.encode()).hexdigest()
+        from auth import hash_password
+        password_hash = hash_password(new_password)
         self.cursor.execute('''
             UPDATE admin_users 
             SET password_hash = ?
             WHERE username = ?
         ''', (password_hash, username))
-        self.conn.commit()
+        self._commit()
         return self.cursor.rowcount > 0
         
     def delete_admin(self, user_id):
         self.cursor.execute('DELETE FROM admin_users WHERE user_id = ?', (user_id,))
-        self.conn.commit()
+        self._commit()
         return self.cursor.rowcount > 0
         
     def close(self):
@@ -242,8 +741,32 @@ class AttendanceDB:
     def __del__(self):
         self.close()
 
-def initialize_database():
-    db = AttendanceDB()
+def _tree_order(rows):
+    # Sorts department rows (id, name, parent_id, ...) so each parent is followed
+    # by its children, siblings by name
+    children = {}
+    for row in rows:
+        children.setdefault(row[2], []).append(row)
+    ordered = []
+    stack = sorted(children.get(None, []), key=lambda row: row[1], reverse=True)
+    while stack:
+        row = stack.pop()
+        ordered.append(row)
+        stack.extend(sorted(children.get(row[0], []), key=lambda child: child[1], reverse=True))
+    return ordered
+
+def readonly_uri(db_name):
+    return Path(db_name).resolve().as_uri() + '?mode=ro'
+
+def connect_readonly(db_name):
+    # For readers that must never write (or migrate) the database they open
+    return sqlite3.connect(readonly_uri(db_name), uri=True)
+
+def initialize_database(db=None):
+    # Reuse the caller's connection when given one instead of opening a second
+    owns_connection = db is None
+    if owns_connection:
+        db = AttendanceDB()
     
     # Check if any admin exists, if not create a default one
     db.cursor.execute('SELECT COUNT(*) FROM admin_users')
@@ -251,7 +774,8 @@ def initialize_database():
         print("No admin users found. Creating default admin account (username: admin, password: admin)")
         db.add_admin_user('admin', 'admin', 'System Administrator', 'Super Admin')
     
-    db.close()
+    if owns_connection:
+        db.close()
 
 if __name__ == '__main__':
     initialize_database()
@@ -0,0 +1,506 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+from attendance import AttendanceDB
+
+EMPLOYEE_COLUMNS = ('employee_id', 'name', 'barcode_id', 'department', 'position', 'hire_date', 'status')
+SHIFT_COLUMNS = ('shift_id', 'name', 'start_time', 'end_time', 'description')
+ATTENDANCE_COLUMNS = ('record_id', 'employee_id', 'date', 'time_in', 'time_out', 'status', 'name')
+ADMIN_COLUMNS = ('user_id', 'username', 'full_name', 'role')
+DEPARTMENT_COLUMNS = ('department_id', 'name', 'parent_id', 'level', 'headcount')
+ROLLUP_COLUMNS = DEPARTMENT_COLUMNS + ('present', 'absent', 'late')
+
+# Admin commands authenticate with these instead of prompting
+ADMIN_USER_ENV = 'ATTENDANCE_ADMIN_USER'
+ADMIN_PASSWORD_ENV = 'ATTENDANCE_ADMIN_PASSWORD'
+NEW_PASSWORD_ENV = 'ATTENDANCE_NEW_PASSWORD'
+
+
+class CLIError(Exception):
+    pass
+
+
+def as_dicts(rows, columns):
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def read_rows(path):
+    # Batch input is either a JSON list of objects or a CSV file with a header row
+    if path == '-':
+        text = sys.stdin.read()
+    else:
+        with open(path, newline='') as f:
+            text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return list(csv.DictReader(text.splitlines()))
+
+
+def write_output(data, output=None, fmt='json'):
+    f = open(output, 'w', newline='') if output else sys.stdout
+    try:
+        if fmt == 'csv' and isinstance(data, list):
+            if data:
+                writer = csv.DictWriter(f, fieldnames=list(data[0].keys()))
+                writer.writeheader()
+                writer.writerows(data)
+        else:
+            json.dump(data, f, indent=2, default=str)
+            f.write('\n')
+    finally:
+        if output:
+            f.close()
+
+
+def parse_when(value):
+    if not value:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise CLIError(f"Invalid timestamp '{value}', expected YYYY-MM-DD HH:MM:SS")
+
+
+def require_admin(db, super_admin=False):
+    username = os.environ.get(ADMIN_USER_ENV)
+    password = os.environ.get(ADMIN_PASSWORD_ENV)
+    if not username or not password:
+        raise CLIError(f"Set {ADMIN_USER_ENV} and {ADMIN_PASSWORD_ENV} to run admin commands")
+    if not db.cursor.execute('SELECT COUNT(*) FROM admin_users').fetchone()[0]:
+        raise CLIError("No admin users yet; start the console once to create the first one")
+    admin = db.verify_admin(username, password)
+    if not admin:
+        raise CLIError("Invalid admin credentials")
+    if super_admin and admin[4] != 'Super Admin':
+        raise CLIError("Only Super Admins can run this command")
+    return admin
+
+
+# Command handlers: each takes (db, args) and returns JSON-serialisable data. Handlers
+# registered with opens_db=False get db=None and read their own files.
+
+def cmd_punch(db, args):
+    punches = [(barcode, args.at) for barcode in args.barcodes]
+    if args.file:
+        punches += [(row['barcode_id'], row.get('timestamp')) for row in read_rows(args.file)]
+    if not punches:
+        raise CLIError("No barcodes given")
+
+    if args.debounce > 0:
+        from scanner import ScanDebouncer
+        db.debouncer = ScanDebouncer(window=args.debounce)
+
+    # Punches are checked once the batch commits; while it runs the monitor's
+    # alert writes would wait on the batch's lock and its queue would overflow
+    writes = []
+    collect = lambda table, details: writes.append((table, details))
+    db.add_write_listener(collect)
+    results = []
+    try:
+        with db.batch():
+            for barcode, timestamp in punches:
+                employee, action, punch_time = db.punch_barcode(barcode, parse_when(timestamp),
+                                                                terminal=args.terminal)
+                results.append({
+                    'barcode_id': barcode,
+                    'employee_id': employee[0] if employee else None,
+                    'name': employee[1] if employee else None,
+                    'action': action,
+                    'time': punch_time,
+                })
+    finally:
+        db.remove_write_listener(collect)
+
+    from anomalies import AnomalyMonitor
+    monitor = AnomalyMonitor(db)
+    try:
+        monitor.replay(writes)
+    finally:
+        monitor.close()
+    metrics = db.debouncer.metrics if db.debouncer else None
+    return {'punches': results, 'metrics': metrics, 'alerts': monitor.metrics['alerts'],
+            'anomaly_metrics': monitor.metrics}
+
+
+def cmd_import_employees(db, args):
+    added, skipped = 0, []
+    with db.batch():
+        for row in read_rows(args.file):
+            if db.add_employee(row['name'], row['barcode_id'], row.get('department'),
+                               row.get('position'), row.get('hire_date')):
+                added += 1
+            else:
+                skipped.append(row['barcode_id'])
+    return {'added': added, 'skipped': skipped}
+
+
+def cmd_import_attendance(db, args):
+    created, updated, unknown = 0, 0, []
+    with db.batch():
+        for row in read_rows(args.file):
+            employee = db.get_employee_by_barcode(row['barcode_id'])
+            if not employee:
+                unknown.append(row['barcode_id'])
+                continue
+            if db.record_attendance(employee[0], row['date'], time_in=row.get('time_in') or None,
+                                    time_out=row.get('time_out') or None,
+                                    status=row.get('status') or 'Present'):
+                created += 1
+            else:
+                updated += 1
+    return {'created': created, 'updated': updated, 'unknown_barcodes': unknown}
+
+
+def cmd_export(db, args):
+    if args.what == 'employees':
+        data = as_dicts(db.get_all_employees(), EMPLOYEE_COLUMNS)
+    elif args.what == 'shifts':
+        data = as_dicts(db.get_all_shifts(), SHIFT_COLUMNS)
+    else:
+        if not args.start or not args.end:
+            raise CLIError("--start and --end are required to export attendance")
+        data = as_dicts(db.get_attendance_records(args.start, args.end, args.employee_id),
+                        ATTENDANCE_COLUMNS)
+    write_output(data, args.output, args.format)
+    return None if not args.output else {'exported': len(data), 'output': args.output}
+
+
+def cmd_report(db, args):
+    from reports import build_report, write_report
+
+    if args.type == 'daily':
+        params = {'date': args.date or datetime.now().strftime('%Y-%m-%d')}
+    elif args.type == 'range':
+        params = {'start_date': args.start, 'end_date': args.end}
+    else:
+        params = {'employee_id': args.employee_id, 'start_date': args.start, 'end_date': args.end}
+    if None in params.values():
+        raise CLIError(f"Missing arguments for the {args.type} report")
+
+    report = build_report(db, args.type, **params)
+    if args.output:
+        write_report(report, args.output)
+        return {'output': args.output}
+    if 'records' in report:
+        report['records'] = as_dicts(report['records'], ATTENDANCE_COLUMNS)
+    return report
+
+
+def cmd_shift(db, args):
+    if args.action == 'list':
+        return as_dicts(db.get_all_shifts(), SHIFT_COLUMNS)
+    elif args.action == 'add':
+        shift_id = db.add_shift(args.name, args.start_time, args.end_time, args.description)
+        return {'shift_id': shift_id}
+
+    assignments = []
+    if args.employee_id and args.shift_id:
+        assignments.append({'employee_id': args.employee_id, 'shift_id': args.shift_id,
+                            'effective_date': args.date})
+    if args.file:
+        assignments += read_rows(args.file)
+    if not assignments:
+        raise CLIError("Give --employee-id and --shift-id or --file")
+    today = datetime.now().strftime('%Y-%m-%d')
+    with db.batch():
+        for row in assignments:
+            db.assign_shift_to_employee(int(row['employee_id']), int(row['shift_id']),
+                                        row.get('effective_date') or today)
+    return {'assigned': len(assignments)}
+
+
+def cmd_department(db, args):
+    if args.action == 'list':
+        return as_dicts(db.get_departments(), DEPARTMENT_COLUMNS)
+    elif args.action == 'rollup':
+        return as_dicts(db.get_department_rollup(args.start, args.end or args.start), ROLLUP_COLUMNS)
+
+    ids = {row[1]: row[0] for row in db.get_departments()}
+    for name in (args.parent,) + ((args.name,) if args.action == 'move' else ()):
+        if name and name not in ids:
+            raise CLIError(f"No department named {name!r}")
+    parent_id = ids.get(args.parent)
+    if args.action == 'add':
+        department_id = db.add_department(args.name, parent_id)
+        if department_id is None:
+            raise CLIError(f"Department {args.name!r} already exists")
+        return {'department_id': department_id}
+    if not db.move_department(ids[args.name], parent_id):
+        raise CLIError(f"Cannot move {args.name!r} under its own subtree")
+    return {'moved': args.name, 'parent': args.parent}
+
+
+def cmd_admin(db, args):
+    if args.action == 'list':
+        require_admin(db)
+        return as_dicts(db.get_all_admins(), ADMIN_COLUMNS)
+
+    if args.action == 'delete':
+        current = require_admin(db, super_admin=True)
+        if args.user_id == current[0]:
+            raise CLIError("You cannot delete yourself")
+        return {'deleted': db.delete_admin(args.user_id)}
+
+    new_password = os.environ.get(NEW_PASSWORD_ENV)
+    if not new_password:
+        raise CLIError(f"Set {NEW_PASSWORD_ENV} to the new password")
+
+    if args.action == 'add':
+        require_admin(db, super_admin=True)
+        if args.role not in ('Admin', 'Super Admin'):
+            raise CLIError("Role must be either 'Admin' or 'Super Admin'")
+        if not db.add_admin_user(args.username, new_password, args.full_name, args.role):
+            raise CLIError("Username may already exist")
+        return {'added': args.username}
+
+    # Admins may change their own password, only Super Admins anyone else's
+    require_admin(db, super_admin=args.username != os.environ.get(ADMIN_USER_ENV))
+    return {'changed': db.change_admin_password(args.username, new_password)}
+
+
+def cmd_sync(db, args):
+    from sync import open_central, site_id_for, sync_site
+
+    central = open_central(args.central)
+    try:
+        return sync_site(db.conn, central, args.site_id or site_id_for(db.conn),
+                         batch_size=args.batch_size, prune=args.prune)
+    finally:
+        central.close()
+
+
+def cmd_federated(db, args):
+    from federation import FederatedReader
+
+    reader = FederatedReader(args.sites, max_workers=args.workers)
+    if args.type == 'daily':
+        return reader.daily_report(args.date or datetime.now().strftime('%Y-%m-%d'))
+    if not args.start or not args.end:
+        raise CLIError(f"--start and --end are required for the {args.type} query")
+    if args.type == 'range':
+        return reader.date_range_report(args.start, args.end)
+    return as_dicts(reader.get_attendance_records(args.start, args.end),
+                    ('site_id',) + ATTENDANCE_COLUMNS)
+
+
+def cmd_timesheet(db, args):
+    from timesheet import generate_timesheets
+
+    output = args.output or f"timesheet_{args.start}_{args.end}.csv"
+    return generate_timesheets(args.db, args.start, args.end, output, max_workers=args.workers)
+
+
+def cmd_staffing(db, args):
+    from analytics import STAFFING_COLUMNS, staffing_profile
+
+    rows = staffing_profile(db, args.start, args.end or args.start, args.department, args.interval)
+    return as_dicts(rows, STAFFING_COLUMNS)
+
+
+def cmd_alerts(db, args):
+    from anomalies import ALERT_COLUMNS, backfill, get_alerts
+
+    end = args.end or args.start
+    if args.action == 'backfill':
+        return backfill(db, args.start, end)
+    return as_dicts(get_alerts(db.conn, args.start, end, args.kind), ALERT_COLUMNS)
+
+
+def cmd_streaks(db, args):
+    from bitmaps import attendance_summaries, missed_streaks
+
+    end = args.end or datetime.now().strftime('%Y-%m-%d')
+    if args.missed:
+        return as_dicts(missed_streaks(db.conn, args.start, end, args.missed),
+                        ('employee_id', 'name', 'longest_missed'))
+    summaries = attendance_summaries(db.conn, args.start, end)
+    return [dict(employee_id=employee_id, **{key: value for key, value in summary.items()
+                                             if key != 'missed'})
+            for employee_id, summary in summaries.items()]
+
+
+def cmd_integrity(db, args):
+    from integrity import IntegrityChecker
+
+    checker = IntegrityChecker(db, chunk_size=args.chunk_size)
+    report = checker.check()
+    if args.action == 'check':
+        return report
+    require_admin(db, super_admin=True)
+    return {
+        'found': {check: len(found) for check, found in report.items()},
+        'archived_orphans': checker.archive_orphans(report),
+        'merged_duplicates': checker.merge_duplicates(report),
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Non-interactive attendance system commands")
+    parser.add_argument('--db', default='attendance_system.db', help="database file")
+    parser.add_argument('--foreign-keys', action='store_true',
+                        help="reject writes that reference missing employees, shifts or departments")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    punch = sub.add_parser('punch', help="record time in/out for barcodes")
+    punch.add_argument('barcodes', nargs='*')
+    punch.add_argument('--at', help="timestamp (YYYY-MM-DD HH:MM:SS), default now")
+    punch.add_argument('--file', help="CSV/JSON with barcode_id and optional timestamp, '-' for stdin")
+    punch.add_argument('--debounce', type=float, default=2.0,
+                       help="seconds within which repeat reads of a barcode are dropped, 0 to disable")
+    punch.add_argument('--terminal', help="name of the terminal the reads came from")
+    punch.set_defaults(handler=cmd_punch)
+
+    imp = sub.add_parser('import', help="bulk load employees or attendance")
+    imp_sub = imp.add_subparsers(dest='what', required=True)
+    imp_emp = imp_sub.add_parser('employees')
+    imp_emp.add_argument('file')
+    imp_emp.set_defaults(handler=cmd_import_employees)
+    imp_att = imp_sub.add_parser('attendance')
+    imp_att.add_argument('file')
+    imp_att.set_defaults(handler=cmd_import_attendance)
+
+    exp = sub.add_parser('export', help="dump employees, shifts or attendance")
+    exp.add_argument('what', choices=('employees', 'shifts', 'attendance'))
+    exp.add_argument('--start')
+    exp.add_argument('--end')
+    exp.add_argument('--employee-id', type=int)
+    exp.add_argument('--format', choices=('json', 'csv'), default='json')
+    exp.add_argument('--output')
+    exp.set_defaults(handler=cmd_export)
+
+    report = sub.add_parser('report', help="daily, range or employee report")
+    report.add_argument('type', choices=('daily', 'range', 'employee'))
+    report.add_argument('--date')
+    report.add_argument('--start')
+    report.add_argument('--end')
+    report.add_argument('--employee-id', type=int)
+    report.add_argument('--output', help="write the report as CSV instead of printing JSON")
+    report.set_defaults(handler=cmd_report)
+
+    shift = sub.add_parser('shift', help="manage shifts")
+    shift_sub = shift.add_subparsers(dest='action', required=True)
+    shift_sub.add_parser('list')
+    shift_add = shift_sub.add_parser('add')
+    shift_add.add_argument('name')
+    shift_add.add_argument('start_time')
+    shift_add.add_argument('end_time')
+    shift_add.add_argument('--description')
+    shift_assign = shift_sub.add_parser('assign')
+    shift_assign.add_argument('--employee-id', type=int)
+    shift_assign.add_argument('--shift-id', type=int)
+    shift_assign.add_argument('--date', help="effective date, default today")
+    shift_assign.add_argument('--file', help="CSV/JSON with employee_id, shift_id, effective_date")
+    shift.set_defaults(handler=cmd_shift)
+
+    department = sub.add_parser('department', help="department tree and attendance rolled up through it")
+    department_sub = department.add_subparsers(dest='action', required=True)
+    department_sub.add_parser('list')
+    for action in ('add', 'move'):
+        department_action = department_sub.add_parser(action)
+        department_action.add_argument('name')
+        department_action.add_argument('--parent', help="parent department name, default top level")
+    department_rollup = department_sub.add_parser('rollup')
+    department_rollup.add_argument('--start', required=True)
+    department_rollup.add_argument('--end', help="default: same as --start")
+    department.set_defaults(handler=cmd_department)
+
+    admin = sub.add_parser('admin', help=f"manage admins (credentials from {ADMIN_USER_ENV}/{ADMIN_PASSWORD_ENV})")
+    admin_sub = admin.add_subparsers(dest='action', required=True)
+    admin_sub.add_parser('list')
+    admin_add = admin_sub.add_parser('add', help=f"password from {NEW_PASSWORD_ENV}")
+    admin_add.add_argument('username')
+    admin_add.add_argument('full_name')
+    admin_add.add_argument('role')
+    admin_passwd = admin_sub.add_parser('passwd', help=f"password from {NEW_PASSWORD_ENV}")
+    admin_passwd.add_argument('username')
+    admin_delete = admin_sub.add_parser('delete')
+    admin_delete.add_argument('user_id', type=int)
+    admin.set_defaults(handler=cmd_admin)
+
+    sync = sub.add_parser('sync', help="ship changes since the last sync to a central database")
+    sync.add_argument('central', help="central database file")
+    sync.add_argument('--site-id', help="default: the ID stored in the site database")
+    sync.add_argument('--batch-size', type=int, default=1000)
+    sync.add_argument('--prune', action='store_true', help="delete acknowledged changelog rows")
+    sync.set_defaults(handler=cmd_sync)
+
+    staffing = sub.add_parser('staffing', help="average people on site by time of day against the shift plan")
+    staffing.add_argument('--start', required=True)
+    staffing.add_argument('--end', help="default: same as --start")
+    staffing.add_argument('--department')
+    staffing.add_argument('--interval', type=int, default=60, help="bucket size in minutes")
+    staffing.set_defaults(handler=cmd_staffing)
+
+    alerts = sub.add_parser('alerts', help="suspicious punches: card bursts, off-shift punches, long shifts")
+    alerts.add_argument('action', choices=('list', 'backfill'),
+                        help="backfill checks stored attendance in the date range")
+    alerts.add_argument('--start', required=True)
+    alerts.add_argument('--end', help="default: same as --start")
+    alerts.add_argument('--kind', choices=('burst', 'off_shift', 'long_shift'))
+    alerts.set_defaults(handler=cmd_alerts)
+
+    streaks = sub.add_parser('streaks', help="attendance percentages and streaks per employee")
+    streaks.add_argument('--start', required=True)
+    streaks.add_argument('--end', help="default: today")
+    streaks.add_argument('--missed', type=int, metavar='DAYS',
+                         help="only employees who missed at least DAYS days in a row")
+    streaks.set_defaults(handler=cmd_streaks)
+
+    integrity = sub.add_parser('integrity', help="find orphaned, inconsistent and duplicate records")
+    integrity.add_argument('action', choices=('check', 'repair'),
+                           help="repair archives orphans and merges duplicates (Super Admin)")
+    integrity.add_argument('--chunk-size', type=int, default=1000)
+    integrity.set_defaults(handler=cmd_integrity)
+
+    timesheet = sub.add_parser('timesheet', help="payroll hours per employee for a pay period")
+    timesheet.add_argument('--start', required=True)
+    timesheet.add_argument('--end', required=True)
+    timesheet.add_argument('--output', help="CSV file, default timesheet_<start>_<end>.csv")
+    timesheet.add_argument('--workers', type=int)
+    timesheet.set_defaults(handler=cmd_timesheet, opens_db=False)
+
+    federated = sub.add_parser('federated', help="query several site databases at once")
+    federated.add_argument('type', choices=('daily', 'range', 'records'))
+    federated.add_argument('sites', nargs='+', help="site database files")
+    federated.add_argument('--date')
+    federated.add_argument('--start')
+    federated.add_argument('--end')
+    federated.add_argument('--workers', type=int)
+    federated.set_defaults(handler=cmd_federated, opens_db=False)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db = None
+    try:
+        # Only commands that work on --db open (and so create or migrate) it. The
+        # default admin account is left to the interactive console.
+        if getattr(args, 'opens_db', True):
+            db = AttendanceDB(args.db, enforce_foreign_keys=args.foreign_keys)
+        result = args.handler(db, args)
+        if result is not None:
+            write_output(result)
+        return 0
+    except (CLIError, KeyError, ValueError, OSError, sqlite3.Error) as e:
+        # sqlite3.Error covers constraint failures (--foreign-keys) and locked databases
+        message = f"Missing field {e}" if isinstance(e, KeyError) else str(e)
+        json.dump({'error': message}, sys.stderr)
+        sys.stderr.write('\n')
+        return 1
+    finally:
+        if db is not None:
+            db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+# Cost parameters for new hashes. Existing hashes made with other parameters
+# are upgraded the next time their owner logs in.
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600000
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+SESSION_TTL = 15 * 60  # seconds
+
+_dummy_hash = None
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, iterations=PBKDF2_ITERATIONS):
+    salt = os.urandom(SALT_BYTES)
+    if hasattr(hashlib, 'scrypt'):
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=KEY_BYTES)
+        return f"scrypt${n}${r}${p}${salt.hex()}${digest.hex()}"
+    # Python builds without OpenSSL scrypt support fall back to PBKDF2
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, KEY_BYTES)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+
+def is_legacy_hash(stored_hash):
+    # Hashes written before salted hashing were a bare SHA-256 hex digest
+    return '$' not in stored_hash
+
+
+def verify_password(password, stored_hash):
+    try:
+        if is_legacy_hash(stored_hash):
+            digest = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(digest, stored_hash)
+
+        parts = stored_hash.split('$')
+        if parts[0] == 'scrypt':
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            salt, expected = bytes.fromhex(parts[4]), bytes.fromhex(parts[5])
+            digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                                    dklen=len(expected))
+        elif parts[0] == 'pbkdf2_sha256':
+            iterations = int(parts[1])
+            salt, expected = bytes.fromhex(parts[2]), bytes.fromhex(parts[3])
+            digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations,
+                                         len(expected))
+        else:
+            return False
+    except (ValueError, IndexError):
+        return False
+    return hmac.compare_digest(digest, expected)
+
+
+def needs_rehash(stored_hash):
+    if is_legacy_hash(stored_hash):
+        return True
+    parts = stored_hash.split('$')
+    if hasattr(hashlib, 'scrypt'):
+        return parts[:4] != ['scrypt', str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+    return parts[:2] != ['pbkdf2_sha256', str(PBKDF2_ITERATIONS)]
+
+
+def dummy_verify(password):
+    # Spend the same time on unknown usernames so they can't be told apart
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password('')
+    verify_password(password, _dummy_hash)
+
+
+class SessionCache:
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, user):
+        import secrets
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[token] = (user, time.monotonic() + self.ttl)
+        return token
+
+    def get(self, token):
+        if not token:
+            return None
+        with self._lock:
+            session = self._sessions.get(token)
+            if not session:
+                return None
+            user, expires = session
+            if time.monotonic() >= expires:
+                del self._sessions[token]
+                return None
+            # Sliding expiry: activity keeps the session alive
+            self._sessions[token] = (user, time.monotonic() + self.ttl)
+            return user
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def revoke_user(self, username):
+        with self._lock:
+            for token in [t for t, (user, _) in self._sessions.items() if user[1] == username]:
+                del self._sessions[token]
+
+
+def benchmark_login(rounds=10):
+    from attendance import AttendanceDB
+
+    db = AttendanceDB(':memory:')
+    db.add_admin_user('bench', 'bench-password', 'Benchmark User', 'Admin')
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        db.verify_admin('bench', 'bench-password')
+    login = (time.perf_counter() - start) / rounds
+
+    sessions = SessionCache()
+    token = sessions.create(db.verify_admin('bench', 'bench-password'))
+    start = time.perf_counter()
+    for _ in range(rounds * 1000):
+        sessions.get(token)
+    session = (time.perf_counter() - start) / (rounds * 1000)
+
+    db.close()
+    return login, session
+
+
+if __name__ == '__main__':
+    scheme = f"scrypt (n={SCRYPT_N}, r={SCRYPT_R}, p={SCRYPT_P})" if hasattr(hashlib, 'scrypt') \
+        else f"pbkdf2_sha256 ({PBKDF2_ITERATIONS} iterations)"
+    login, session = benchmark_login()
+    print(f"Hash scheme:          {scheme}")
+    print(f"Login (verify_admin): {login * 1000:.1f} ms")
+    print(f"Session cache lookup: {session * 1000000:.2f} us")
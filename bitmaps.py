@@ -0,0 +1,189 @@
+from datetime import date, datetime, timedelta
+
+# One bitmap per employee, year and status; bit n is day n of the year (0 = Jan 1)
+BITMAP_STATUSES = ('Present', 'Absent', 'Late')
+BITMAP_BYTES = 46  # 366 days
+# Days of the week (Monday = 0) employees are expected in when nothing is marked
+WORKING_WEEKDAYS = (0, 1, 2, 3, 4)
+
+
+def _day(value):
+    # (year, bit index) for a YYYY-MM-DD date; None for anything else, which is
+    # stored in attendance but left out of the bitmaps
+    try:
+        day = date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return day.year, day.timetuple().tm_yday - 1
+
+
+def _encode(bits):
+    return bits.to_bytes(BITMAP_BYTES, 'little')
+
+
+def _decode(blob):
+    return int.from_bytes(blob, 'little')
+
+
+def set_day_status(conn, employee_id, day, status):
+    # Sets day's bit in status's bitmap and clears it in the others. Runs in the
+    # caller's transaction.
+    position = _day(day)
+    if position is None:
+        return
+    year, index = position
+    bit = 1 << index
+    stored = dict(conn.execute('''
+        SELECT status, bits FROM attendance_bitmaps WHERE employee_id = ? AND year = ?
+    ''', (employee_id, year)))
+    for name in BITMAP_STATUSES:
+        old = _decode(stored[name]) if name in stored else 0
+        new = old | bit if name == status else old & ~bit
+        if new != old:
+            conn.execute('''
+                INSERT INTO attendance_bitmaps (employee_id, year, status, bits) VALUES (?, ?, ?, ?)
+                ON CONFLICT (employee_id, year, status) DO UPDATE SET bits = excluded.bits
+            ''', (employee_id, year, name, _encode(new)))
+
+
+def rebuild_bitmaps(conn, employee_ids=None):
+    # Recomputes the bitmaps from the attendance table, for everyone or only the
+    # given employees. Runs in the caller's transaction.
+    where, params = '', []
+    if employee_ids is not None:
+        employee_ids = list(employee_ids)
+        where = f"WHERE employee_id IN ({', '.join('?' for _ in employee_ids)})"
+        params = employee_ids
+    conn.execute(f'DELETE FROM attendance_bitmaps {where}', params)
+
+    bitmaps = {}
+    for employee_id, day, status in conn.execute(f'''
+        SELECT employee_id, date, status FROM attendance {where}
+        ORDER BY record_id
+    ''', params):
+        position = _day(day)
+        if position is None:
+            continue
+        year, index = position
+        for name in BITMAP_STATUSES:
+            key = (employee_id, year, name)
+            if name == status:
+                bitmaps[key] = bitmaps.get(key, 0) | 1 << index
+            elif key in bitmaps:
+                bitmaps[key] &= ~(1 << index)
+    conn.executemany('''
+        INSERT INTO attendance_bitmaps (employee_id, year, status, bits) VALUES (?, ?, ?, ?)
+    ''', [key + (_encode(bits),) for key, bits in bitmaps.items()])
+    return len(bitmaps)
+
+
+def range_mask(start, end, first=None, last=None):
+    # Bits for the days first..last (inclusive) of a range starting at start
+    first = max(first or start, start)
+    last = min(last or end, end)
+    if last < first:
+        return 0
+    return ((1 << (last - first).days + 1) - 1) << (first - start).days
+
+
+def load_bitmaps(conn, start_date, end_date, employee_ids=None):
+    # Returns {employee_id: {status: bits}} with bit 0 = start_date, read from one
+    # row per employee, year and status
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    days = (end - start).days + 1
+    query = '''
+        SELECT employee_id, year, status, bits FROM attendance_bitmaps
+        WHERE year BETWEEN ? AND ?
+    '''
+    params = [start.year, end.year]
+    if employee_ids is not None:
+        employee_ids = list(employee_ids)
+        query += f" AND employee_id IN ({', '.join('?' for _ in employee_ids)})"
+        params += employee_ids
+
+    bitmaps = {}
+    for employee_id, year, status, blob in conn.execute(query, params):
+        offset = (date(year, 1, 1) - start).days
+        bits = _decode(blob)
+        bits = bits << offset if offset >= 0 else bits >> -offset
+        statuses = bitmaps.setdefault(employee_id, dict.fromkeys(BITMAP_STATUSES, 0))
+        statuses[status] |= bits & ((1 << days) - 1)
+    return bitmaps
+
+
+def working_day_mask(start, end):
+    # Bits for the days of start..end that fall on WORKING_WEEKDAYS
+    bits = 0
+    for offset in range((end - start).days + 1):
+        if (start + timedelta(days=offset)).weekday() in WORKING_WEEKDAYS:
+            bits |= 1 << offset
+    return bits
+
+
+def count_bits(bits):
+    return bin(bits).count('1')
+
+
+def longest_run(bits, gaps=0):
+    # Most bits set in one run of consecutive days, where the days in gaps neither
+    # break a run nor count towards it. One step per run: x & ~(x + lowest bit)
+    # isolates the lowest run of x.
+    span = bits | gaps
+    longest = 0
+    while span:
+        run = span & ~(span + (span & -span))
+        longest = max(longest, count_bits(run & bits))
+        span &= ~run
+    return longest
+
+
+def attendance_summaries(conn, start_date, end_date, employee_ids=None):
+    # Per-employee counts, percentages and streaks for the range. Working days
+    # from the hire date up to today with no Present or Late mark count as missed,
+    # as does any day marked Absent. Unmarked days off are skipped over by streaks.
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    today = datetime.now().date()
+    bitmaps = load_bitmaps(conn, start_date, end_date, employee_ids)
+    working = working_day_mask(start, end)
+    days_off = range_mask(start, end) & ~working
+
+    query = 'SELECT employee_id, name, hire_date FROM employees'
+    params = []
+    if employee_ids is not None:
+        employee_ids = list(employee_ids)
+        query += f" WHERE employee_id IN ({', '.join('?' for _ in employee_ids)})"
+        params = employee_ids
+
+    summaries = {}
+    for employee_id, name, hire_date in conn.execute(query, params):
+        statuses = bitmaps.get(employee_id, dict.fromkeys(BITMAP_STATUSES, 0))
+        try:
+            hired = date.fromisoformat(hire_date) if hire_date else None
+        except ValueError:
+            hired = None
+        attended = statuses['Present'] | statuses['Late']
+        missed = (range_mask(start, end, hired, today) & working & ~attended) | statuses['Absent']
+        gaps = days_off & ~attended & ~missed
+        counts = {status: count_bits(bits) for status, bits in statuses.items()}
+        total = count_bits(attended | missed)
+        summaries[employee_id] = {
+            'name': name,
+            'counts': counts,
+            'expected_days': total,
+            'percentages': {status: round(count / total * 100, 1) if total else 0.0
+                            for status, count in counts.items()},
+            'longest_streak': longest_run(attended, gaps),
+            'longest_missed': longest_run(missed, gaps),
+            'missed': missed,
+        }
+    return summaries
+
+
+def missed_streaks(conn, start_date, end_date, days):
+    # Employees with at least `days` consecutive missed days in the range, as
+    # (employee_id, name, longest missed run), longest first
+    rows = [(employee_id, summary['name'], summary['longest_missed'])
+            for employee_id, summary in attendance_summaries(conn, start_date, end_date).items()
+            if summary['longest_missed'] >= days]
+    rows.sort(key=lambda row: (-row[2], row[1]))
+    return rows
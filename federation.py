@@ -0,0 +1,144 @@
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from attendance import connect_readonly, readonly_uri
+from reports import STATUSES
+from sync import site_id_for
+
+# SQLite's default compile-time limit on attached databases per connection
+SQLITE_MAX_ATTACHED = 10
+
+RECORDS_SQL = '''
+    SELECT ? AS site_id, a.*, e.name
+    FROM {schema}.attendance a
+    JOIN {schema}.employees e ON a.employee_id = e.employee_id
+    WHERE a.date BETWEEN ? AND ?
+'''
+
+STATUS_COUNTS_SQL = '''
+    SELECT ? AS site_id, status, COUNT(*)
+    FROM {schema}.attendance
+    WHERE date BETWEEN ? AND ?
+    GROUP BY status
+'''
+
+EMPLOYEE_COUNT_SQL = '''
+    SELECT ? AS site_id, COUNT(*) FROM {schema}.employees
+'''
+
+EMPLOYEE_TOTALS_SQL = '''
+    SELECT ? AS site_id, a.employee_id, e.name,
+           SUM(a.status = 'Present'), SUM(a.status = 'Absent'), SUM(a.status = 'Late')
+    FROM {schema}.attendance a
+    JOIN {schema}.employees e ON a.employee_id = e.employee_id
+    WHERE a.date BETWEEN ? AND ?
+    GROUP BY a.employee_id
+'''
+
+
+def query_group(sites, queries):
+    # Runs in a worker process: attach one group of sites read-only and run each
+    # query as a UNION ALL across them
+    conn = sqlite3.connect('file::memory:', uri=True)
+    try:
+        for idx, (site_id, db_name) in enumerate(sites):
+            conn.execute(f'ATTACH DATABASE ? AS site{idx}', (readonly_uri(db_name),))
+
+        results = []
+        for template, params in queries:
+            sql = ' UNION ALL '.join(template.format(schema=f'site{idx}') for idx in range(len(sites)))
+            args = []
+            for site_id, _ in sites:
+                args += [site_id] + list(params)
+            results.append(conn.execute(sql, args).fetchall())
+        return results
+    finally:
+        conn.close()
+
+
+class FederatedReader:
+    def __init__(self, site_dbs, group_size=SQLITE_MAX_ATTACHED, max_workers=None):
+        # site_dbs is a list of database files or a {site_id: database file} dict
+        if not isinstance(site_dbs, dict):
+            site_dbs = self._key_sites(site_dbs)
+        self.sites = sorted(site_dbs.items())
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+        # Spread sites over the workers without exceeding the attach limit
+        per_group = -(-len(self.sites) // self.max_workers) if self.sites else 1
+        self.group_size = max(1, min(group_size, SQLITE_MAX_ATTACHED, per_group))
+
+    @staticmethod
+    def _key_sites(db_names):
+        # Sites are keyed by the ID stored in each database, or the full path for
+        # older ones; two files with the same key would be counted as one site
+        sites = {}
+        for db_name in db_names:
+            conn = connect_readonly(db_name)
+            try:
+                site_id = site_id_for(conn) or str(Path(db_name).resolve())
+            finally:
+                conn.close()
+            if site_id in sites:
+                raise ValueError(f"{db_name} and {sites[site_id]} are the same site ({site_id})")
+            sites[site_id] = db_name
+        return sites
+
+    def groups(self):
+        return [self.sites[i:i + self.group_size] for i in range(0, len(self.sites), self.group_size)]
+
+    def _run(self, queries):
+        # Returns one merged row list per query
+        groups = self.groups()
+        merged = [[] for _ in queries]
+        if len(groups) <= 1:
+            partials = [query_group(group, queries) for group in groups]
+        else:
+            with ProcessPoolExecutor(max_workers=min(len(groups), self.max_workers)) as executor:
+                partials = list(executor.map(query_group, groups, [queries] * len(groups)))
+        for partial in partials:
+            for idx, rows in enumerate(partial):
+                merged[idx].extend(rows)
+        return merged
+
+    def get_attendance_records(self, start_date, end_date):
+        # Same columns as AttendanceDB.get_attendance_records with site_id in front
+        records, = self._run([(RECORDS_SQL, (start_date, end_date))])
+        return sorted(records, key=lambda record: (record[3], record[7], record[0]))
+
+    def daily_report(self, date):
+        status_rows, employee_rows = self._run([(STATUS_COUNTS_SQL, (date, date)),
+                                                (EMPLOYEE_COUNT_SQL, ())])
+        sites = {site_id: {'counts': {status: 0 for status in STATUSES}, 'total_employees': 0}
+                 for site_id, _ in self.sites}
+        for site_id, status, count in status_rows:
+            if status in STATUSES:
+                sites[site_id]['counts'][status] = count
+        for site_id, count in employee_rows:
+            sites[site_id]['total_employees'] = count
+
+        return {
+            'type': 'daily',
+            'date': date,
+            'counts': {status: sum(site['counts'][status] for site in sites.values())
+                       for status in STATUSES},
+            'total_employees': sum(site['total_employees'] for site in sites.values()),
+            'sites': sites,
+        }
+
+    def date_range_report(self, start_date, end_date):
+        rows, = self._run([(EMPLOYEE_TOTALS_SQL, (start_date, end_date))])
+        sites = {site_id: {} for site_id, _ in self.sites}
+        for site_id, employee_id, name, present, absent, late in rows:
+            sites[site_id][employee_id] = {
+                'name': name,
+                'counts': dict(zip(STATUSES, (present, absent, late))),
+            }
+        return {
+            'type': 'range',
+            'start_date': start_date,
+            'end_date': end_date,
+            'sites': sites,
+        }
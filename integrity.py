@@ -0,0 +1,182 @@
+from datetime import datetime
+
+from attendance import TRACKED_TABLES
+from bitmaps import rebuild_bitmaps
+
+# Rows read per query and rows changed per repair transaction
+CHUNK_SIZE = 1000
+
+
+def _columns(table):
+    key, columns = TRACKED_TABLES[table]
+    return ', '.join((key,) + columns)
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class IntegrityChecker:
+    # Scans in keyset-paginated chunks (WHERE id > last ORDER BY id LIMIT n), so
+    # each query is short and never holds a lock for long on a busy database
+    def __init__(self, db, chunk_size=CHUNK_SIZE):
+        self.db = db
+        self.chunk_size = chunk_size
+
+    def _scan(self, query, last_id=0):
+        while True:
+            rows = self.db.conn.execute(query, (last_id, self.chunk_size)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def _ids(self, table, key):
+        return {row[0] for row in self._scan(
+            f'SELECT {key} FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?')}
+
+    def check(self):
+        employees = self._ids('employees', 'employee_id')
+        shifts = self._ids('shifts', 'shift_id')
+        overnight = {row[0] for row in self.db.conn.execute(
+            'SELECT shift_id FROM shifts WHERE end_time < start_time')}
+
+        report = {
+            'orphan_attendance': [],
+            'orphan_shift_assignments': [],
+            'time_out_before_time_in': [],
+            'duplicate_attendance': [],
+        }
+
+        for record_id, employee_id, date, time_in, time_out in self._scan('''
+            SELECT record_id, employee_id, date, time_in, time_out FROM attendance
+            WHERE record_id > ? ORDER BY record_id LIMIT ?
+        '''):
+            if employee_id not in employees:
+                report['orphan_attendance'].append(record_id)
+            elif time_in and time_out and time_out < time_in:
+                # Legitimate when the employee works a shift that crosses midnight
+                shift = self.db.get_employee_shift(employee_id, date)
+                if not shift or shift[0] not in overnight:
+                    report['time_out_before_time_in'].append(record_id)
+
+        for assignment_id, employee_id, shift_id in self._scan('''
+            SELECT assignment_id, employee_id, shift_id FROM employee_shifts
+            WHERE assignment_id > ? ORDER BY assignment_id LIMIT ?
+        '''):
+            if employee_id not in employees or shift_id not in shifts:
+                report['orphan_shift_assignments'].append(assignment_id)
+
+        report['duplicate_attendance'] = list(self.duplicate_groups())
+        return report
+
+    def duplicate_groups(self):
+        # Yields (employee_id, date, [record_ids]) one employee-id chunk at a time,
+        # using the (employee_id, date) index
+        last_id = 0
+        while True:
+            ids = [row[0] for row in self.db.conn.execute('''
+                SELECT DISTINCT employee_id FROM attendance
+                WHERE employee_id > ? ORDER BY employee_id LIMIT ?
+            ''', (last_id, self.chunk_size))]
+            if not ids:
+                return
+            for employee_id, date, record_ids in self.db.conn.execute('''
+                SELECT employee_id, date, group_concat(record_id)
+                FROM attendance
+                WHERE employee_id BETWEEN ? AND ?
+                GROUP BY employee_id, date
+                HAVING COUNT(*) > 1
+            ''', (ids[0], ids[-1])):
+                yield employee_id, date, sorted(int(i) for i in record_ids.split(','))
+            last_id = ids[-1]
+
+    def _archive(self, table, archive, key, ids, reason):
+        # One bounded transaction per chunk
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for chunk in _chunks(ids, self.chunk_size):
+            marks = ', '.join('?' for _ in chunk)
+            with self.db.conn:
+                self.db.conn.execute(f'''
+                    INSERT OR REPLACE INTO {archive} ({_columns(table)}, archived_at, reason)
+                    SELECT {_columns(table)}, ?, ? FROM {table} WHERE {key} IN ({marks})
+                ''', [now, reason] + chunk)
+                self.db.conn.execute(f'DELETE FROM {table} WHERE {key} IN ({marks})', chunk)
+        return len(ids)
+
+    def _rebuild_bitmaps(self, employee_ids):
+        for chunk in _chunks(sorted(employee_ids), self.chunk_size):
+            with self.db.conn:
+                rebuild_bitmaps(self.db.conn, chunk)
+
+    def archive_orphans(self, report=None):
+        report = report or self.check()
+        employee_ids = set()
+        for chunk in _chunks(report['orphan_attendance'], self.chunk_size):
+            marks = ', '.join('?' for _ in chunk)
+            employee_ids.update(row[0] for row in self.db.conn.execute(
+                f'SELECT DISTINCT employee_id FROM attendance WHERE record_id IN ({marks})', chunk))
+        archived = {
+            'attendance': self._archive('attendance', 'attendance_archive', 'record_id',
+                                        report['orphan_attendance'], 'orphan'),
+            'employee_shifts': self._archive('employee_shifts', 'employee_shifts_archive',
+                                             'assignment_id', report['orphan_shift_assignments'],
+                                             'orphan'),
+        }
+        self._rebuild_bitmaps(employee_ids)
+        return archived
+
+    def merge_duplicates(self, report=None):
+        # Keeps the oldest row of each (employee, date) group with the earliest
+        # time in and latest time out of the group; the other rows are archived
+        groups = report['duplicate_attendance'] if report else list(self.duplicate_groups())
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        columns = _columns('attendance')
+        merged = 0
+        for chunk in _chunks(groups, self.chunk_size):
+            with self.db.conn:
+                for employee_id, date, record_ids in chunk:
+                    marks = ', '.join('?' for _ in record_ids)
+                    rows = self.db.conn.execute(f'''
+                        SELECT record_id, time_in, time_out, status FROM attendance
+                        WHERE record_id IN ({marks}) ORDER BY record_id
+                    ''', record_ids).fetchall()
+                    if len(rows) < 2:
+                        continue
+                    keep, extra = rows[0][0], [row[0] for row in rows[1:]]
+                    time_in = min((row[1] for row in rows if row[1]), default=None)
+                    time_out = max((row[2] for row in rows if row[2]), default=None)
+                    status = next((row[3] for row in rows if row[3]), None)
+
+                    extra_marks = ', '.join('?' for _ in extra)
+                    self.db.conn.execute(f'''
+                        INSERT OR REPLACE INTO attendance_archive ({columns}, archived_at, reason)
+                        SELECT {columns}, ?, 'duplicate' FROM attendance
+                        WHERE record_id IN ({extra_marks})
+                    ''', [now] + extra)
+                    self.db.conn.execute(f'DELETE FROM attendance WHERE record_id IN ({extra_marks})',
+                                         extra)
+                    self.db.conn.execute('''
+                        UPDATE attendance SET time_in = ?, time_out = ?, status = ?
+                        WHERE record_id = ?
+                    ''', (time_in, time_out, status, keep))
+                    merged += len(extra)
+            # Let caches and boards pick up the merged rows
+            for employee_id, date, record_ids in chunk:
+                self.db._notify_write('attendance', record_id=record_ids[0], employee_id=employee_id,
+                                      date=date, **self._row_state(record_ids[0]))
+        self._rebuild_bitmaps({group[0] for group in groups})
+        return merged
+
+    def _row_state(self, record_id):
+        row = self.db.conn.execute('SELECT time_in, time_out, status FROM attendance WHERE record_id = ?',
+                                   (record_id,)).fetchone()
+        return dict(zip(('time_in', 'time_out', 'status'), row or (None, None, None)))
+
+    def repair(self):
+        report = self.check()
+        return {
+            'archived_orphans': self.archive_orphans(report),
+            'merged_duplicates': self.merge_duplicates(report),
+        }
@@ -0,0 +1,210 @@
+import argparse
+import json
+import multiprocessing
+import queue
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from attendance import AttendanceDB
+
+LOAD_BARCODE_PREFIX = 'LOAD-'
+# Seconds past the run's duration to wait for workers to report
+RESULT_GRACE = 30.0
+
+
+def is_busy_error(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def count_error(errors, error):
+    errors[str(error)] = errors.get(str(error), 0) + 1
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def seed_employees(db_name, count):
+    db = AttendanceDB(db_name)
+    barcodes = [f"{LOAD_BARCODE_PREFIX}{i:05d}" for i in range(count)]
+    with db.batch():
+        for barcode in barcodes:
+            db.add_employee(f"Load Test {barcode}", barcode, 'Load Test', 'Scanner', '2000-01-01')
+    db.close()
+    return barcodes
+
+
+def scanner_worker(db_name, worker_id, rate, duration, barcodes, days, busy_timeout,
+                   max_retries, results):
+    # Simulates one scanner: Poisson arrivals at `rate` punches per second through
+    # the real punch path. Punches are spread over `days` simulated dates so they
+    # keep writing instead of settling into "attendance complete".
+    rng = random.Random(worker_id)
+    latencies, retries, failures, errors = [], 0, 0, {}
+    db = None
+    # Anything that stops the worker, even opening the database, is reported back
+    # as a failure so the parent never waits on a result that will not come
+    try:
+        db = AttendanceDB(db_name, timeout=busy_timeout)
+        first_day = datetime.now() - timedelta(days=days)
+
+        start = time.perf_counter()
+        next_at = start
+        while True:
+            next_at += rng.expovariate(rate)
+            if next_at - start >= duration:
+                break
+            time.sleep(max(0, next_at - time.perf_counter()))
+
+            barcode = rng.choice(barcodes)
+            when = first_day + timedelta(days=rng.randrange(days))
+            began = time.perf_counter()
+            for attempt in range(max_retries + 1):
+                try:
+                    db.punch_barcode(barcode, when)
+                    latencies.append(time.perf_counter() - began)
+                    break
+                except sqlite3.OperationalError as e:
+                    db.conn.rollback()
+                    if not is_busy_error(e) or attempt == max_retries:
+                        failures += 1
+                        count_error(errors, e)
+                        break
+                    retries += 1
+                    time.sleep(min(0.05, 0.001 * 2 ** attempt) * rng.random())
+    except Exception as e:
+        failures += 1
+        count_error(errors, e)
+    finally:
+        if db is not None:
+            db.close()
+        results.put({'worker': multiprocessing.current_process().name, 'role': 'scanner',
+                     'latencies': latencies, 'retries': retries, 'failures': failures,
+                     'errors': errors})
+
+
+def reader_worker(db_name, worker_id, duration, days, busy_timeout, results):
+    # Simulates a report screen: repeated range queries over the punched dates
+    latencies, failures, errors = [], 0, {}
+    db = None
+    try:
+        db = AttendanceDB(db_name, timeout=busy_timeout)
+        end_date = datetime.now().strftime('%Y-%m-%d')
+        start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+        stop = time.perf_counter() + duration
+        while time.perf_counter() < stop:
+            began = time.perf_counter()
+            try:
+                db.get_attendance_records(start_date, end_date)
+                latencies.append(time.perf_counter() - began)
+            except sqlite3.OperationalError as e:
+                failures += 1
+                count_error(errors, e)
+    except Exception as e:
+        failures += 1
+        count_error(errors, e)
+    finally:
+        if db is not None:
+            db.close()
+        results.put({'worker': multiprocessing.current_process().name, 'role': 'reader',
+                     'latencies': latencies, 'retries': 0, 'failures': failures,
+                     'errors': errors})
+
+
+def summarize(samples, duration):
+    latencies = [latency for sample in samples for latency in sample['latencies']]
+    errors = {}
+    for sample in samples:
+        for message, count in sample['errors'].items():
+            errors[message] = errors.get(message, 0) + count
+    return {
+        'completed': len(latencies),
+        'throughput_per_sec': round(len(latencies) / duration, 2),
+        'latency_ms': {f"p{pct}": round(percentile(latencies, pct) * 1000, 2) if latencies else None
+                       for pct in (50, 95, 99)},
+        'max_latency_ms': round(max(latencies) * 1000, 2) if latencies else None,
+        'busy_retries': sum(sample['retries'] for sample in samples),
+        'failures': sum(sample['failures'] for sample in samples),
+        'errors': errors,
+    }
+
+
+def run_load_test(db_name, scanners=4, readers=1, rate=5.0, duration=10.0, employees=200,
+                  days=365, busy_timeout=0.1, max_retries=5):
+    barcodes = seed_employees(db_name, employees)
+    results = multiprocessing.Queue()
+
+    workers = [multiprocessing.Process(target=scanner_worker, name=f'scanner-{i}',
+                                       args=(db_name, i, rate, duration, barcodes, days,
+                                             busy_timeout, max_retries, results))
+               for i in range(scanners)]
+    workers += [multiprocessing.Process(target=reader_worker, name=f'reader-{i}',
+                                        args=(db_name, i, duration, days, busy_timeout, results))
+                for i in range(readers)]
+
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    # Drain the queue before joining so workers never block on a full pipe. Stop
+    # waiting once every worker has exited, or at the deadline for a hung one.
+    samples = []
+    deadline = started + duration + RESULT_GRACE
+    while len(samples) < len(workers):
+        running = any(worker.is_alive() for worker in workers)
+        try:
+            samples.append(results.get(timeout=0.5))
+        except queue.Empty:
+            if not running or time.perf_counter() > deadline:
+                break
+    for worker in workers:
+        worker.join(timeout=1.0)
+        if worker.is_alive():
+            worker.terminate()
+            worker.join()
+
+    # Workers that died without reporting count as one failure each
+    reported = {sample['worker'] for sample in samples}
+    for worker in workers:
+        if worker.name not in reported:
+            samples.append({'worker': worker.name, 'role': worker.name.split('-')[0],
+                            'latencies': [], 'retries': 0, 'failures': 1,
+                            'errors': {f"worker exited with code {worker.exitcode}": 1}})
+    elapsed = time.perf_counter() - started
+
+    return {
+        'db': db_name,
+        'scanners': scanners,
+        'readers': readers,
+        'rate_per_scanner': rate,
+        'duration_sec': round(elapsed, 2),
+        'punches': summarize([s for s in samples if s['role'] == 'scanner'], elapsed),
+        'reports': summarize([s for s in samples if s['role'] == 'reader'], elapsed),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrent scanner/report load test for one database file")
+    parser.add_argument('--db', default='loadtest.db',
+                        help="database to load (load-test employees are added to it)")
+    parser.add_argument('--scanners', type=int, default=4, help="scanner worker processes")
+    parser.add_argument('--readers', type=int, default=1, help="report reader processes")
+    parser.add_argument('--rate', type=float, default=5.0, help="punches per second per scanner")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to run")
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365, help="simulated dates punches are spread over")
+    parser.add_argument('--busy-timeout', type=float, default=0.1,
+                        help="seconds SQLite waits on a lock before reporting busy")
+    parser.add_argument('--max-retries', type=int, default=5)
+    args = parser.parse_args()
+
+    print(json.dumps(run_load_test(args.db, args.scanners, args.readers, args.rate, args.duration,
+                                   args.employees, args.days, args.busy_timeout, args.max_retries),
+                     indent=2))
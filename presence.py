@@ -0,0 +1,106 @@
+from datetime import datetime
+
+UNASSIGNED = 'Unassigned'
+
+
+class PresenceBoard:
+    # Who is on site right now, kept in memory and updated from the punch stream
+    def __init__(self, db, date=None):
+        self.db = db
+        # Without a fixed date the board follows the calendar and resets at midnight
+        self.follow_today = date is None
+        self.date = date or datetime.now().strftime('%Y-%m-%d')
+        self.on_site = {}        # employee_id -> (name, department, time_in)
+        self.by_department = {}  # department -> set of employee_ids
+        self._employees = {}     # employee_id -> (name, department)
+        self.seed()
+        db.add_write_listener(self.on_write)
+
+    def seed(self):
+        # One query for everyone clocked in but not yet out today
+        self.on_site.clear()
+        self.by_department.clear()
+        self.db.cursor.execute('''
+            SELECT a.employee_id, e.name, e.department, a.time_in
+            FROM attendance a
+            JOIN employees e ON a.employee_id = e.employee_id
+            WHERE a.date = ? AND a.time_in IS NOT NULL AND a.time_out IS NULL
+        ''', (self.date,))
+        for employee_id, name, department, time_in in self.db.cursor.fetchall():
+            self._employees[employee_id] = (name, department or UNASSIGNED)
+            self._add(employee_id, time_in)
+
+    def check_date(self):
+        # Nobody from yesterday is on today's board, even before today's first punch
+        today = datetime.now().strftime('%Y-%m-%d')
+        if self.follow_today and today > self.date:
+            self.date = today
+            self.seed()
+
+    def close(self):
+        self.db.remove_write_listener(self.on_write)
+
+    def on_write(self, table, details):
+        if table == 'attendance':
+            if details['date'] != self.date:
+                # Today's first punch rolls a calendar board over to a fresh day (the
+                # new seed includes it); entries for any other date, e.g. next
+                # week's, never move the board
+                if self.follow_today and details['date'] == datetime.now().strftime('%Y-%m-%d'):
+                    self.check_date()
+                return
+            if details['time_in'] and not details['time_out']:
+                self._add(details['employee_id'], details['time_in'])
+            else:
+                self._remove(details['employee_id'])
+        elif table == 'employees':
+            employee_id = details['employee_id']
+            self._employees.pop(employee_id, None)
+            if employee_id in self.on_site:
+                time_in = self.on_site[employee_id][2]
+                self._remove(employee_id)
+                # Re-add under the employee's current name and department
+                if self.db.get_employee(employee_id):
+                    self._add(employee_id, time_in)
+
+    def _employee(self, employee_id):
+        if employee_id not in self._employees:
+            employee = self.db.get_employee(employee_id)
+            if not employee:
+                return None
+            self._employees[employee_id] = (employee[1], employee[3] or UNASSIGNED)
+        return self._employees[employee_id]
+
+    def _add(self, employee_id, time_in):
+        employee = self._employee(employee_id)
+        if not employee:
+            return
+        self._remove(employee_id)
+        name, department = employee
+        self.on_site[employee_id] = (name, department, time_in)
+        self.by_department.setdefault(department, set()).add(employee_id)
+
+    def _remove(self, employee_id):
+        entry = self.on_site.pop(employee_id, None)
+        if entry:
+            members = self.by_department[entry[1]]
+            members.discard(employee_id)
+            if not members:
+                del self.by_department[entry[1]]
+
+    def headcount(self, department=None):
+        self.check_date()
+        if department is None:
+            return len(self.on_site)
+        return len(self.by_department.get(department, ()))
+
+    def department_counts(self):
+        self.check_date()
+        return {department: len(members) for department, members in self.by_department.items()}
+
+    def roster(self, department=None):
+        # Returns (employee_id, name, department, time_in) sorted by department and name
+        self.check_date()
+        ids = self.on_site if department is None else self.by_department.get(department, ())
+        rows = [(employee_id,) + self.on_site[employee_id] for employee_id in ids]
+        return sorted(rows, key=lambda row: (row[2], row[1]))
@@ -0,0 +1,358 @@
+import csv
+import itertools
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from attendance import AttendanceDB, readonly_uri
+from bitmaps import attendance_summaries
+
+STATUSES = ('Present', 'Absent', 'Late')
+REPORT_TYPES = ('daily', 'range', 'employee')
+
+# How many rows are processed between progress updates / cancellation checks
+PROGRESS_INTERVAL = 500
+# SQLite virtual machine steps between cancellation checks inside a query
+CANCEL_CHECK_STEPS = 10000
+
+
+class ReportCancelled(Exception):
+    pass
+
+
+def count_statuses(records):
+    counts = {status: 0 for status in STATUSES}
+    for record in records:
+        if record[5] in counts:
+            counts[record[5]] += 1
+    return counts
+
+
+def _iter_with_progress(records, job, total):
+    # records is read in chunks (see AttendanceDB._iter_keyset), so progress and
+    # cancellation follow the rows actually fetched from the database
+    done = 0
+    for done, record in enumerate(records, 1):
+        if job and done % PROGRESS_INTERVAL == 0:
+            job.update(done, total)
+        yield record
+    if job:
+        job.update(done, done)
+
+
+def build_daily_report(db, date, job=None):
+    total = db.count_attendance_records(date, date) if job else None
+    records = list(_iter_with_progress(db.iter_attendance_records(date, date), job, total))
+    counts = count_statuses(records)
+    return {
+        'type': 'daily',
+        'date': date,
+        'records': records,
+        'counts': counts,
+        'total_employees': len(db.get_all_employees()),
+    }
+
+
+def build_date_range_report(db, start_date, end_date, job=None):
+    total = db.count_attendance_records(start_date, end_date) if job else None
+
+    # One row per employee, already counted by the database; progress is in records
+    rows, record_count = [], 0
+    for row in db.iter_attendance_totals(start_date, end_date):
+        rows.append(row)
+        record_count += row[5]
+        if job:
+            job.update(record_count, total)
+    rows.sort(key=lambda row: (row[1], row[0]))
+
+    employee_data = {}
+    for emp_id, name, present, absent, late, _ in rows:
+        employee_data[emp_id] = {
+            'name': name,
+            'counts': dict(zip(STATUSES, (present, absent, late)))
+        }
+
+    return {
+        'type': 'range',
+        'start_date': start_date,
+        'end_date': end_date,
+        'employees': employee_data,
+        'record_count': record_count,
+    }
+
+
+def build_employee_summary(db, employee_id, start_date, end_date, job=None):
+    total = db.count_attendance_records(start_date, end_date, employee_id) if job else None
+    records = list(_iter_with_progress(
+        db.iter_attendance_records(start_date, end_date, employee_id), job, total))
+    # Counts and streaks come from the status bitmaps rather than the rows
+    summary = attendance_summaries(db.conn, start_date, end_date, [employee_id]).get(employee_id)
+    total_days = (datetime.strptime(end_date, '%Y-%m-%d') -
+                  datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+    return {
+        'type': 'employee',
+        'employee_id': employee_id,
+        'start_date': start_date,
+        'end_date': end_date,
+        'records': records,
+        'counts': summary['counts'] if summary else dict.fromkeys(STATUSES, 0),
+        'total_days': total_days,
+        'longest_streak': summary['longest_streak'] if summary else 0,
+        'longest_missed': summary['longest_missed'] if summary else 0,
+    }
+
+
+def build_report(db, report_type, job=None, **params):
+    if report_type == 'daily':
+        return build_daily_report(db, params['date'], job=job)
+    elif report_type == 'range':
+        return build_date_range_report(db, params['start_date'], params['end_date'], job=job)
+    elif report_type == 'employee':
+        return build_employee_summary(db, params['employee_id'], params['start_date'],
+                                      params['end_date'], job=job)
+    raise ValueError(f"Unknown report type: {report_type}")
+
+
+def report_key(report_type, **params):
+    if report_type == 'daily':
+        return (report_type, None, params['date'], params['date'])
+    return (report_type, params.get('employee_id'), params['start_date'], params['end_date'])
+
+
+class ReportCache:
+    def __init__(self, db_name=None, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a report built from stale data isn't cached
+        self._generation = 0
+        # A connection kept open for the cache's lifetime: its PRAGMA data_version
+        # changes whenever any other connection to db_name commits
+        self._watch = None
+        self._data_version = None
+        if db_name:
+            self._watch = sqlite3.connect(readonly_uri(db_name), uri=True, check_same_thread=False)
+            self._data_version = self._watch.execute('PRAGMA data_version').fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, report, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = report
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key, builder):
+        report = self.get(key)
+        if report is not None:
+            return report
+        generation = self._generation
+        report = builder()
+        self.put(key, report, generation)
+        return report
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def check_external_writes(self):
+        # Writes from other terminals never reach invalidate(), so any commit seen
+        # since the last check drops the whole cache
+        if self._watch is None:
+            return
+        with self._lock:
+            version = self._watch.execute('PRAGMA data_version').fetchone()[0]
+            if version == self._data_version:
+                return
+            self._data_version = version
+            self._entries.clear()
+            self._generation += 1
+
+    def close(self):
+        if self._watch is not None:
+            self._watch.close()
+            self._watch = None
+
+    def invalidate(self, table, details):
+        # Write listener for AttendanceDB: drop only the ranges a change can affect
+        if table == 'attendance':
+            date = details['date']
+            self._drop(lambda key: key[2] <= date <= key[3] and
+                       (key[0] != 'employee' or key[1] == details['employee_id']))
+        elif table == 'employee_shifts':
+            effective_date = details['effective_date']
+            self._drop(lambda key: key[3] >= effective_date and
+                       (key[0] != 'employee' or key[1] == details['employee_id']))
+        elif table == 'employees':
+            # Names and headcounts appear in every daily and range report
+            self._drop(lambda key: key[0] != 'employee' or key[1] == details['employee_id'])
+
+    def _drop(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+            self._generation += 1
+
+
+def cached_report(cache, db, report_type, job=None, **params):
+    key = report_key(report_type, **params)
+    # Today and later are still being punched from other terminals, so they are
+    # always rebuilt
+    if cache is None or key[3] >= datetime.now().strftime('%Y-%m-%d'):
+        return build_report(db, report_type, job=job, **params)
+    cache.check_external_writes()
+    return cache.get_or_build(key, lambda: build_report(db, report_type, job=job, **params))
+
+
+def report_rows(report):
+    if report['type'] == 'daily':
+        yield ['ID', 'Name', 'Time In', 'Time Out', 'Status']
+        for record in report['records']:
+            yield [record[1], record[6], record[3] or '-', record[4] or '-', record[5] or '-']
+        counts = report['counts']
+        yield []
+        for status in STATUSES:
+            yield [status, counts[status]]
+        yield ['Not Recorded', report['total_employees'] - sum(counts.values())]
+    elif report['type'] == 'range':
+        yield ['ID', 'Name'] + list(STATUSES)
+        for emp_id, data in report['employees'].items():
+            yield [emp_id, data['name']] + [data['counts'][status] for status in STATUSES]
+    elif report['type'] == 'employee':
+        yield ['Date', 'Time In', 'Time Out', 'Status']
+        for record in report['records']:
+            yield [record[2], record[3] or '-', record[4] or '-', record[5] or '-']
+        counts = report['counts']
+        total_days = report['total_days']
+        yield []
+        yield ['Total Days', total_days]
+        for status in STATUSES:
+            yield [status, counts[status], f"{counts[status]/total_days*100:.1f}%"]
+        yield ['Not Recorded', total_days - sum(counts.values())]
+        yield ['Longest Streak', report['longest_streak']]
+        yield ['Longest Missed Run', report['longest_missed']]
+
+
+def write_report(report, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(report_rows(report))
+    return path
+
+
+class ReportJob:
+    def __init__(self, job_id, report_type, params, output_path):
+        self.job_id = job_id
+        self.report_type = report_type
+        self.params = params
+        self.output_path = output_path
+        self.status = 'Queued'
+        self.progress = 0
+        self.error = None
+        self.future = None
+        self._cancel_event = threading.Event()
+
+    def update(self, done, total):
+        if self._cancel_event.is_set():
+            raise ReportCancelled()
+        # Rows written after the count was taken could push done past total
+        self.progress = min(100, int(done * 100 / total)) if total else 100
+
+    def cancel(self):
+        self._cancel_event.set()
+        # Jobs still waiting in the queue never start
+        if self.future and self.future.cancel():
+            self.status = 'Cancelled'
+
+    @property
+    def finished(self):
+        return self.status in ('Done', 'Cancelled', 'Failed')
+
+
+class ReportJobManager:
+    def __init__(self, db_name='attendance_system.db', max_workers=2, output_dir='reports',
+                 cache=None):
+        self.db_name = db_name
+        self.output_dir = output_dir
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report')
+        self.jobs = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, report_type, output_path=None, **params):
+        if report_type not in REPORT_TYPES:
+            raise ValueError(f"Unknown report type: {report_type}")
+        job_id = next(self._ids)
+        if not output_path:
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            output_path = os.path.join(self.output_dir, f"{report_type}_report_{job_id}_{stamp}.csv")
+        job = ReportJob(job_id, report_type, params, output_path)
+        self.jobs[job_id] = job
+        job.future = self.executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        if job._cancel_event.is_set():
+            job.status = 'Cancelled'
+            return
+        job.status = 'Running'
+        # SQLite connections can't be shared between threads, so each job opens its own
+        db = AttendanceDB(self.db_name)
+        # Checked every few thousand SQLite steps: a cancel stops a long query too
+        db.conn.set_progress_handler(job._cancel_event.is_set, CANCEL_CHECK_STEPS)
+        try:
+            report = cached_report(self.cache, db, job.report_type, job=job, **job.params)
+            job.update(1, 1)
+            write_report(report, job.output_path)
+            job.progress = 100
+            job.status = 'Done'
+        except ReportCancelled:
+            job.status = 'Cancelled'
+        except sqlite3.OperationalError as e:
+            # An interrupted query fails with "interrupted"
+            if job._cancel_event.is_set():
+                job.status = 'Cancelled'
+            else:
+                job.error = str(e)
+                job.status = 'Failed'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'Failed'
+        finally:
+            db.close()
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if not job or job.finished:
+            return False
+        job.cancel()
+        return True
+
+    def shutdown(self, wait=False):
+        # Without waiting, unfinished jobs are cancelled instead of left running
+        if not wait:
+            for job in self.jobs.values():
+                if not job.finished:
+                    job.cancel()
+        self.executor.shutdown(wait=wait)
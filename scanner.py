@@ -0,0 +1,50 @@
+import time
+from collections import OrderedDict
+
+# Reads of the same barcode closer together than this are treated as one scan
+DEBOUNCE_SECONDS = 2.0
+MAX_TRACKED_BARCODES = 1024
+
+
+class ScanDebouncer:
+    def __init__(self, window=DEBOUNCE_SECONDS, max_entries=MAX_TRACKED_BARCODES):
+        self.window = window
+        self.max_entries = max_entries
+        # barcode -> time of the last accepted read, oldest first
+        self._recent = OrderedDict()
+        self.metrics = {'accepted': 0, 'duplicates': 0}
+
+    def accept(self, barcode, now=None):
+        # Returns False for a repeat read of a barcode inside the debounce window
+        if now is None:
+            now = time.monotonic()
+
+        # Entries are kept in arrival order, so expired ones are all at the front
+        while self._recent:
+            oldest = next(iter(self._recent.values()))
+            if now - oldest < self.window:
+                break
+            self._recent.popitem(last=False)
+
+        last = self._recent.get(barcode)
+        if last is not None and abs(now - last) < self.window:
+            self.metrics['duplicates'] += 1
+            return False
+
+        self._recent[barcode] = now
+        self._recent.move_to_end(barcode)
+        if len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+        self.metrics['accepted'] += 1
+        return True
+
+    def touch(self, barcode, now=None):
+        # Restarts the window of a barcode that was already read
+        if now is None:
+            now = time.monotonic()
+        if barcode in self._recent:
+            self._recent[barcode] = now
+            self._recent.move_to_end(barcode)
+
+    def clear(self):
+        self._recent.clear()
@@ -0,0 +1,119 @@
+import json
+import sqlite3
+from datetime import datetime
+
+from attendance import TRACKED_TABLES
+
+SYNC_BATCH_SIZE = 1000
+
+
+def site_id_for(site_conn):
+    # The ID stored in the site database; None for databases made before it existed
+    try:
+        row = site_conn.execute('SELECT site_id FROM site_info').fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def last_sequence(site_conn):
+    # Highest sequence number the site has ever used, pruned changes included
+    row = site_conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changelog'").fetchone()
+    return row[0] if row else 0
+
+
+def open_central(central_db):
+    # The central database mirrors the tracked tables with rows keyed by (site_id, id)
+    conn = sqlite3.connect(central_db)
+    for table, (key, columns) in TRACKED_TABLES.items():
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                site_id TEXT NOT NULL,
+                {key} INTEGER NOT NULL,
+                {', '.join(f'{column}' for column in columns)},
+                changed_at TEXT NOT NULL,
+                PRIMARY KEY (site_id, {key})
+            )
+        ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            site_id TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL,
+            synced_at TEXT
+        )
+    ''')
+    conn.commit()
+    return conn
+
+
+def last_acknowledged(central, site_id):
+    row = central.execute('SELECT last_seq FROM sync_state WHERE site_id = ?', (site_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def apply_change(central, site_id, table, op, row_id, row_data, changed_at):
+    # Conflict rule: the newest change wins; on a tie the site's change is applied.
+    # Returns False when the central copy is newer and the change is skipped.
+    key, columns = TRACKED_TABLES[table]
+    if op == 'D':
+        cursor = central.execute(f'''
+            DELETE FROM {table}
+            WHERE site_id = ? AND {key} = ? AND changed_at <= ?
+        ''', (site_id, row_id, changed_at))
+        return cursor.rowcount > 0 or not central.execute(
+            f'SELECT 1 FROM {table} WHERE site_id = ? AND {key} = ?', (site_id, row_id)).fetchone()
+
+    data = json.loads(row_data)
+    cursor = central.execute(f'''
+        INSERT INTO {table} (site_id, {key}, {', '.join(columns)}, changed_at)
+        VALUES (?, ?, {', '.join('?' for _ in columns)}, ?)
+        ON CONFLICT (site_id, {key}) DO UPDATE SET
+            {', '.join(f'{column} = excluded.{column}' for column in columns)},
+            changed_at = excluded.changed_at
+        WHERE excluded.changed_at >= {table}.changed_at
+    ''', [site_id, row_id] + [data.get(column) for column in columns] + [changed_at])
+    return cursor.rowcount > 0
+
+
+def sync_site(site_conn, central, site_id, batch_size=SYNC_BATCH_SIZE, prune=False):
+    # Ship changes after the last acknowledged sequence, one transaction per batch
+    if not site_id:
+        raise ValueError("The site database has no site ID; pass one with --site-id")
+    last_seq = last_acknowledged(central, site_id)
+    # Central has acknowledged changes this site never made: another database
+    # syncs under the same ID, and its rows would be skipped or overwritten
+    if last_seq > last_sequence(site_conn):
+        raise ValueError(f"Site ID {site_id!r} is already used by another database; "
+                         f"pass a different one with --site-id")
+    applied = skipped = 0
+    while True:
+        changes = site_conn.execute('''
+            SELECT seq, table_name, op, row_id, row_data, changed_at
+            FROM changelog
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        ''', (last_seq, batch_size)).fetchall()
+        if not changes:
+            break
+
+        with central:
+            for seq, table, op, row_id, row_data, changed_at in changes:
+                if apply_change(central, site_id, table, op, row_id, row_data, changed_at):
+                    applied += 1
+                else:
+                    skipped += 1
+            last_seq = changes[-1][0]
+            # The acknowledgement commits atomically with the batch it covers
+            central.execute('''
+                INSERT INTO sync_state (site_id, last_seq, synced_at) VALUES (?, ?, ?)
+                ON CONFLICT (site_id) DO UPDATE SET last_seq = excluded.last_seq,
+                                                    synced_at = excluded.synced_at
+            ''', (site_id, last_seq, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    if prune:
+        # Acknowledged changes are no longer needed on the site
+        with site_conn:
+            site_conn.execute('DELETE FROM changelog WHERE seq <= ?', (last_seq,))
+
+    return {'site_id': site_id, 'applied': applied, 'skipped': skipped, 'last_seq': last_seq}
@@ -0,0 +1,77 @@
+import shutil
+import sys
+from itertools import islice
+
+# Auto-sized columns are fitted to the first page within these bounds; later
+# pages keep the same widths and truncate anything longer
+MIN_AUTO_WIDTH = 8
+MAX_AUTO_WIDTH = 30
+# Rows left free on screen for the title, header and page prompt
+SCREEN_MARGIN = 10
+
+
+def default_page_size():
+    return max(5, shutil.get_terminal_size().lines - SCREEN_MARGIN)
+
+
+class Table:
+    def __init__(self, columns, out=None):
+        # columns is a list of (header, width); a width of None is sized from the first page
+        self.headers = [header for header, _ in columns]
+        self.widths = [width for _, width in columns]
+        self.out = out or sys.stdout
+
+    def _fit(self, rows):
+        for idx, width in enumerate(self.widths):
+            if width is None:
+                longest = max((len(str(row[idx])) for row in rows), default=0)
+                self.widths[idx] = min(MAX_AUTO_WIDTH,
+                                       max(MIN_AUTO_WIDTH, len(self.headers[idx]), longest))
+
+    def _line(self, values):
+        cells = []
+        for value, width in zip(values, self.widths):
+            text = '-' if value is None else str(value)
+            if len(text) > width:
+                text = text[:width - 1] + '~'
+            cells.append(text.ljust(width))
+        return ' '.join(cells).rstrip()
+
+    def format(self, rows, header=True):
+        lines = []
+        if header:
+            lines.append(self._line(self.headers))
+            lines.append('-' * (sum(self.widths) + len(self.widths) - 1))
+        lines.extend(self._line(row) for row in rows)
+        return '\n'.join(lines) + '\n'
+
+    def render(self, rows):
+        # Everything is formatted first and written in one call
+        rows = list(rows)
+        self._fit(rows)
+        self.out.write(self.format(rows))
+        self.out.flush()
+        return len(rows)
+
+    def page(self, rows, page_size=None, prompt="-- {shown} rows shown. Enter for more, 'q' to stop: "):
+        # Pulls one page at a time from rows (a cursor or any iterable), so only the
+        # current page is ever held in memory. Returns the number of rows shown.
+        page_size = page_size or default_page_size()
+        rows = iter(rows)
+        shown = 0
+        page = list(islice(rows, page_size))
+        if not page:
+            return 0
+        self._fit(page)
+        while page:
+            self.out.write(self.format(page, header=shown == 0))
+            self.out.flush()
+            shown += len(page)
+            # Look one row ahead so the prompt only appears when there is more
+            upcoming = list(islice(rows, 1))
+            if not upcoming:
+                break
+            if input(prompt.format(shown=shown)).strip().lower() == 'q':
+                break
+            page = upcoming + list(islice(rows, page_size - 1))
+        return shown
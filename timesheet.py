@@ -0,0 +1,136 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+
+from attendance import connect_readonly
+
+# Hours per ISO week paid at the regular rate; the rest is overtime
+REGULAR_HOURS_PER_WEEK = 40
+# Hours worked inside this window earn the shift differential (may cross midnight)
+NIGHT_START = '22:00:00'
+NIGHT_END = '06:00:00'
+
+TIMESHEET_COLUMNS = ('employee_id', 'name', 'department', 'status', 'days_worked', 'total_hours',
+                     'regular_hours', 'overtime_hours', 'night_hours', 'incomplete_punches')
+
+
+def _parse_time(value):
+    # 'H:MM[:SS]' as a time; raises ValueError when unreadable
+    try:
+        return time(*[int(part) for part in value.split(':')[:3]])
+    except (AttributeError, TypeError) as e:
+        raise ValueError(f"Invalid time: {value!r}") from e
+
+
+def worked_interval(date, time_in, time_out):
+    day = datetime.strptime(date, '%Y-%m-%d')
+    start = datetime.combine(day, _parse_time(time_in))
+    end = datetime.combine(day, _parse_time(time_out))
+    # A time out earlier than the time in means the shift ran past midnight
+    if end < start:
+        end += timedelta(days=1)
+    return start, end
+
+
+def window_overlap(start, end, begin, finish):
+    # Seconds of [start, end) that fall inside the daily window begin-finish (datetime.time)
+    total = 0
+    day = start.date() - timedelta(days=1)
+    while day <= end.date():
+        window_open = datetime.combine(day, begin)
+        window_close = datetime.combine(day if finish > begin else day + timedelta(days=1), finish)
+        overlap = (min(end, window_close) - max(start, window_open)).total_seconds()
+        if overlap > 0:
+            total += overlap
+        day += timedelta(days=1)
+    return total
+
+
+def department_timesheet(db_name, department, start_date, end_date,
+                         regular_hours=REGULAR_HOURS_PER_WEEK, night_start=NIGHT_START,
+                         night_end=NIGHT_END):
+    # Runs in a worker process with its own read-only connection
+    conn = connect_readonly(db_name)
+    try:
+        # One read transaction, so an employee added or moved between the two
+        # queries cannot show up in the punches without being in the employees
+        conn.execute('BEGIN')
+        employees = conn.execute('''
+            SELECT employee_id, name, department, status FROM employees
+            WHERE department IS ?
+        ''', (department,)).fetchall()
+        punches = conn.execute('''
+            SELECT a.employee_id, a.date, a.time_in, a.time_out
+            FROM attendance a
+            JOIN employees e ON a.employee_id = e.employee_id
+            WHERE e.department IS ? AND a.date BETWEEN ? AND ?
+        ''', (department, start_date, end_date)).fetchall()
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+    night_begin = time.fromisoformat(night_start)
+    night_finish = time.fromisoformat(night_end)
+    totals = {employee[0]: {'days': 0, 'weeks': {}, 'night': 0, 'incomplete': 0}
+              for employee in employees}
+    for employee_id, date, time_in, time_out in punches:
+        entry = totals[employee_id]
+        if not time_in or not time_out:
+            entry['incomplete'] += 1
+            continue
+        # Unreadable times and an out in the same second as the in are left for
+        # review instead of failing the run or paying 24 hours
+        try:
+            start, end = worked_interval(date, time_in, time_out)
+        except ValueError:
+            entry['incomplete'] += 1
+            continue
+        if end == start:
+            entry['incomplete'] += 1
+            continue
+        week = start.isocalendar()[:2]
+        entry['days'] += 1
+        entry['weeks'][week] = entry['weeks'].get(week, 0) + (end - start).total_seconds()
+        entry['night'] += window_overlap(start, end, night_begin, night_finish)
+
+    rows = []
+    for employee_id, name, dept, status in employees:
+        entry = totals[employee_id]
+        weekly_hours = [seconds / 3600 for seconds in entry['weeks'].values()]
+        total = sum(weekly_hours)
+        overtime = sum(max(0, hours - regular_hours) for hours in weekly_hours)
+        rows.append((employee_id, name, dept, status, entry['days'], round(total, 2),
+                     round(total - overtime, 2), round(overtime, 2),
+                     round(entry['night'] / 3600, 2), entry['incomplete']))
+    return rows
+
+
+def generate_timesheets(db_name, start_date, end_date, output_path, max_workers=None, **options):
+    conn = connect_readonly(db_name)
+    departments = [row[0] for row in conn.execute('SELECT DISTINCT department FROM employees')]
+    conn.close()
+
+    # One task per department, spread over a process pool
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(department_timesheet, db_name, department, start_date,
+                                   end_date, **options)
+                   for department in departments]
+        rows = [row for future in futures for row in future.result()]
+    rows.sort(key=lambda row: (row[2] or '', row[1], row[0]))
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(TIMESHEET_COLUMNS)
+        writer.writerows(rows)
+
+    return {
+        'output': output_path,
+        'departments': len(departments),
+        'employees': len(rows),
+        'total_hours': round(sum(row[5] for row in rows), 2),
+        'overtime_hours': round(sum(row[7] for row in rows), 2),
+    }